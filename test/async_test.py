@@ -0,0 +1,91 @@
+import asyncio
+import time
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.bench import LOOP_PGM
+from vulcan.checkpoint import checkpoint
+from vulcan.eval import Interpreter, RegisterInterpreter
+from vulcan.prim import PRIMITIVES
+from vulcan.read import read_all
+
+
+class FakeService:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    async def lookup(self, key):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return key * 10
+
+    async def fail(self, key):
+        raise Exception(f'no entry for {key}')
+
+
+PGM = '''
+  (#%let ([a (#%prim fake_lookup (#%datum 1))]
+          [b (#%prim fake_lookup (#%datum 2))])
+    (#%let ([c (#%prim plus a b)])
+      (#%prim add1 c)))
+'''
+
+
+class TestEvalAsync(TestCase):
+    make_interpreter = Interpreter
+
+    def setUp(self):
+        self.service = FakeService(0.05)
+        PRIMITIVES.register_async('fake_lookup', self.service.lookup, 1)
+
+    def tearDown(self):
+        PRIMITIVES.unregister('fake_lookup')
+        if 'fake_fail' in PRIMITIVES.entries:
+            PRIMITIVES.unregister('fake_fail')
+
+    def to_ast(self, a_string):
+        return parse_sexp_seq(read_all(a_string))
+
+    def test_eval_async(self):
+        intp = self.make_interpreter()
+        result = asyncio.run(intp.eval_async(self.to_ast(PGM)))
+        self.assertEqual(result, 31)
+        self.assertEqual(self.service.calls, 2)
+
+    def test_concurrent(self):
+        ast = self.to_ast(PGM)
+
+        async def run_all():
+            return await asyncio.gather(*[self.make_interpreter().eval_async(ast)
+                                          for _ in range(200)])
+        start = time.perf_counter()
+        results = asyncio.run(run_all())
+        elapsed = time.perf_counter() - start
+        self.assertEqual(results, [31] * 200)
+        # 400 awaits of 50ms overlap instead of running one after another
+        self.assertLess(elapsed, 2)
+
+    def test_quantum(self):
+        ast = self.to_ast(LOOP_PGM)
+        intp = self.make_interpreter()
+        result = asyncio.run(intp.eval_async(ast, quantum=1000))
+        self.assertEqual(result, 12502500)
+
+    def test_raise_clears_pending(self):
+        PRIMITIVES.register_async('fake_fail', self.service.fail, 1)
+        intp = self.make_interpreter()
+        ast = self.to_ast('(#%prim fake_fail (#%datum 1))')
+        with self.assertRaisesRegex(Exception, 'no entry for 1'):
+            asyncio.run(intp.eval_async(ast))
+        self.assertIsNone(intp.pending)
+        self.assertEqual(intp.eval(self.to_ast('(#%prim add1 (#%datum 1))')), 2)
+        checkpoint(intp)
+
+    def test_sync_eval_rejects(self):
+        with self.assertRaises(Exception):
+            self.make_interpreter().eval(self.to_ast(PGM))
+
+
+class TestRegisterEvalAsync(TestEvalAsync):
+    make_interpreter = RegisterInterpreter
@@ -0,0 +1,55 @@
+import pickle
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.batch import eval_batch, measure_scaling
+from vulcan.bench import FIB_PGM
+from vulcan.eval import Interpreter
+from vulcan.read import read_all
+from vulcan.resolve import resolve
+from vulcan.type import Box, undefined
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+class TestPickle(TestCase):
+    def test_undefined_identity(self):
+        self.assertIs(pickle.loads(pickle.dumps(undefined)), undefined)
+        box = pickle.loads(pickle.dumps(Box(undefined)))
+        self.assertIs(box.value, undefined)
+
+    def test_ast_round_trip(self):
+        ast = resolve(to_ast(FIB_PGM))
+        copy = pickle.loads(pickle.dumps(ast))
+        self.assertEqual(Interpreter().eval(copy), 987)
+        prim = copy.body.b_exprs[0]
+        self.assertIs(prim.prim, ast.body.b_exprs[0].prim)
+
+    def test_closure_round_trip(self):
+        ast = to_ast('''
+          (#%let ([b (#%prim box (#%datum 41))])
+            (#%lambda () (#%prim unbox b)))''')
+        closure = Interpreter().eval(ast)
+        copy = pickle.loads(pickle.dumps(closure))
+        self.assertEqual(copy.env.get('b').value, 41)
+
+
+class TestBatch(TestCase):
+    def test_eval_batch(self):
+        ast = to_ast('(#%prim plus x y)')
+        jobs = [(ast, {'x': i, 'y': 1}) for i in range(20)]
+        jobs.append((ast, {'x': 1}))
+        results = list(eval_batch(jobs, workers=2))
+        self.assertEqual(len(results), 21)
+        by_index = {r.index: r for r in results}
+        self.assertEqual([by_index[i].value for i in range(20)],
+                         [i + 1 for i in range(20)])
+        self.assertIsNotNone(by_index[20].error)
+
+    def test_scaling(self):
+        jobs = [(to_ast(FIB_PGM), {})] * 4
+        stats = measure_scaling(jobs, [1, 2])
+        self.assertEqual([s.workers for s in stats], [1, 2])
+        self.assertTrue(all(s.throughput > 0 for s in stats))
@@ -0,0 +1,110 @@
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.bench import FIB_PGM, SUM_PGM
+from vulcan.checkpoint import checkpoint, restore
+from vulcan.eval import HamtEnv, Interpreter, RegisterInterpreter, Suspended
+from vulcan.limits import AccountingInterpreter, Limits, ResourceLimitExceeded
+from vulcan.memo import MemoCache, mark_pure
+from vulcan.optimize import optimize
+from vulcan.profiler import ProfilingInterpreter
+from vulcan.read import read_all
+from vulcan.resolve import resolve
+from vulcan.type import unlink
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+class TestCheckpoint(TestCase):
+    make_interpreter = Interpreter
+
+    def test_restore_and_finish(self):
+        intp = self.make_interpreter()
+        result = intp.eval(to_ast(FIB_PGM), max_steps=5000)
+        self.assertIsInstance(result, Suspended)
+        data = checkpoint(intp)
+        copy = restore(data)
+        self.assertIsInstance(copy, self.make_interpreter)
+        self.assertEqual(copy.run(), 987)
+        self.assertEqual(intp.run(), 987)
+
+    def test_repeated(self):
+        intp = self.make_interpreter()
+        result = intp.eval(resolve(to_ast(SUM_PGM)), max_steps=1000)
+        while isinstance(result, Suspended):
+            intp = restore(checkpoint(intp, compress=False))
+            result = intp.run(1000)
+        self.assertEqual(result, 2001000)
+
+    def test_sharing(self):
+        intp = self.make_interpreter()
+        intp.eval(to_ast(SUM_PGM), max_steps=10000)
+        frames = unlink(intp.stack.frames)
+        self.assertGreater(len(frames), 500)
+        copy = restore(checkpoint(intp))
+        copy_frames = unlink(copy.stack.frames)
+        self.assertEqual(len(copy_frames), len(frames))
+        envs = {id(f.env) for f in frames}
+        copy_envs = {id(f.env) for f in copy_frames}
+        self.assertEqual(len(copy_envs), len(envs))
+
+    def test_continuation(self):
+        pgm = '''
+          (#%let ([saved (#%prim box (#%datum #f))])
+            (#%let ([v (#%prim call_cc (#%lambda (k)
+                                         (#%prim set_box saved k)
+                                         (#%datum 1)))])
+              (#%let ([big (#%prim is_equal v (#%datum 3))])
+                (#%if big
+                  v
+                  (#%let ([k (#%prim unbox saved)]
+                          [v1 (#%prim add1 v)])
+                    (#%app k v1))))))'''
+        intp = self.make_interpreter()
+        result = intp.eval(to_ast(pgm), max_steps=12)
+        self.assertIsInstance(result, Suspended)
+        self.assertEqual(restore(checkpoint(intp)).run(), 3)
+
+    def test_configuration(self):
+        intp = self.make_interpreter(memo=MemoCache(), local_env=HamtEnv)
+        intp.eval(to_ast(FIB_PGM), max_steps=5000)
+        copy = restore(checkpoint(intp))
+        self.assertIsInstance(copy.memo, MemoCache)
+        self.assertIs(copy.local_env, HamtEnv)
+        self.assertEqual(copy.run(), 987)
+
+    def test_pure_marks(self):
+        memo = MemoCache()
+        intp = self.make_interpreter(memo=memo)
+        ast = mark_pure(resolve(optimize(to_ast(FIB_PGM))))
+        intp.eval(ast, max_steps=10)
+        copy = restore(checkpoint(intp))
+        self.assertEqual(copy.run(), 987)
+        self.assertEqual(copy.memo.stats()['hits'], 14)
+
+
+class TestRegisterCheckpoint(TestCheckpoint):
+    make_interpreter = RegisterInterpreter
+
+
+class TestCheckpointSubclasses(TestCase):
+    def test_limits(self):
+        intp = AccountingInterpreter(limits=Limits(max_objects=300))
+        result = intp.eval(to_ast(SUM_PGM), max_steps=100)
+        self.assertIsInstance(result, Suspended)
+        copy = restore(checkpoint(intp))
+        self.assertEqual(copy.limits.max_objects, 300)
+        self.assertEqual(copy.usage.objects, intp.usage.objects)
+        with self.assertRaises(ResourceLimitExceeded):
+            copy.run()
+
+    def test_profile(self):
+        intp = ProfilingInterpreter()
+        intp.eval(to_ast(FIB_PGM), max_steps=5000)
+        copy = restore(checkpoint(intp))
+        self.assertEqual(copy.run(), 987)
+        self.assertEqual(copy.profile.max_depth, intp.profile.max_depth)
+        self.assertGreater(sum(n for n, _ in copy.profile.nodes.values()),
+                           sum(n for n, _ in intp.profile.nodes.values()))
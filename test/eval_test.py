@@ -1,11 +1,34 @@
 
-from unittest import TestCase
+import sys
+from unittest import TestCase, skip
 
+from vulcan import codegen
 from vulcan.ast import parse_sexp_seq
-from vulcan.eval import Interpreter
+from vulcan.codegen import PythonCompiler
+from vulcan.compiler import Compiler
+from vulcan.eval import HamtEnv, Interpreter, RegisterInterpreter
+from vulcan.lower import lower
+from vulcan.optimize import optimize
 from vulcan.read import read_all
+from vulcan.resolve import resolve
 
 
+SUM_PGM = '''
+  (#%let ([sum-loc (#%prim box (#%datum #undefined))])
+    (#%prim set_box
+               sum-loc
+               (#%lambda (x)
+                 (#%let ([is_zero-result (#%prim is_zero x)])
+                   (#%if is_zero-result
+                         (#%datum 0)
+                         (#%let ([rec (#%prim unbox sum-loc)]
+                                 [x0  (#%prim sub1 x)])
+                           (#%let ([x1 (#%app rec x0)])
+                             (#%prim plus x x1)))))))
+    (#%let ([sum (#%prim unbox sum-loc)])
+      (#%app sum (#%datum {n}))))
+'''
+
 class TestInterpreter(TestCase):
     def setUp(self):
         self.intp = Interpreter()
@@ -105,3 +128,295 @@ class TestInterpreter(TestCase):
         ast = self.to_ast(pgm)
         self.assertEqual(self.intp.eval(ast), 5)
 
+
+    def test_deep_recursion(self):
+        ast = self.to_ast(SUM_PGM.format(n=5000))
+        self.assertEqual(self.intp.eval(ast), 12502500)
+
+    def test_copy_rebound_in_let(self):
+        ast = self.to_ast('''
+          (#%app (#%lambda (x)
+                   (#%let ([y x] [x (#%prim add1 x)]) y))
+                 (#%datum 5))''')
+        self.assertEqual(self.intp.eval(ast), 5)
+
+    def test_copy_rebound_in_rand(self):
+        ast = self.to_ast('''
+          (#%app (#%lambda (x)
+                   (#%let ([y x])
+                     (#%app (#%lambda (x) y) (#%datum 100))))
+                 (#%datum 5))''')
+        self.assertEqual(self.intp.eval(ast), 5)
+
+    def test_if_chain(self):
+        chain = '(#%datum 5)'
+        for i in range(120):
+            chain = f'(#%if f (#%datum {i}) {chain})'
+        ast = self.to_ast(f'(#%let ([f (#%datum #f)]) {chain})')
+        self.assertEqual(self.intp.eval(ast), 5)
+        ast = self.to_ast(f'(#%let ([f (#%datum #f)]) (#%let ([y {chain}]) y))')
+        self.assertEqual(self.intp.eval(ast), 5)
+
+    def test_letrec(self):
+        pgm = '''
+          (#%letrec ([even? (#%lambda (n)
+                              (#%let ([nz (#%prim is_zero n)])
+                                (#%if nz nz
+                                  (#%let ([n-1 (#%prim sub1 n)])
+                                    (#%app odd? n-1)))))]
+                     [odd? (#%lambda (n)
+                             (#%let ([nz (#%prim is_zero n)])
+                               (#%if nz (#%datum #f)
+                                 (#%let ([n-1 (#%prim sub1 n)])
+                                   (#%app even? n-1)))))])
+            (#%app even? (#%datum 101)))
+        '''
+        ast = self.to_ast(pgm)
+        self.assertEqual(self.intp.eval(ast), False)
+
+    def test_many_bindings(self):
+        binds = ' '.join(f'[x{i} (#%prim add1 (#%datum {i}))] [y{i} x]'
+                         for i in range(50))
+        pgm = f'''
+          (#%let ([x (#%datum 7)])
+            (#%let ({binds})
+              (#%let ([a (#%prim plus x0 x49)])
+                (#%prim plus a y30))))'''
+        ast = self.to_ast(pgm)
+        self.assertEqual(self.intp.eval(ast), 58)
+
+    def test_call_cc_let_reenter(self):
+        pgm = '''
+          (#%let ([saved (#%prim box (#%datum #f))]
+                  [count (#%prim box (#%datum 0))])
+            (#%let ([a (#%datum 1)]
+                    [b (#%prim call_cc (#%lambda (k)
+                                         (#%prim set_box saved k)
+                                         (#%datum 10)))]
+                    [c (#%prim add1 (#%datum 1))])
+              (#%let ([n (#%prim unbox count)])
+                (#%let ([n1 (#%prim add1 n)])
+                  (#%prim set_box count n1)
+                  (#%let ([done (#%prim is_equal n1 (#%datum 2))])
+                    (#%if done
+                      (#%prim plus b c)
+                      (#%let ([k (#%prim unbox saved)])
+                        (#%app k (#%datum 20)))))))))
+        '''
+        ast = self.to_ast(pgm)
+        self.assertEqual(self.intp.eval(ast), 22)
+
+    def test_call_cc_escape(self):
+        pgm = '''
+          (#%let ([f (#%lambda (k)
+                       (#%let ([ignored (#%app k (#%datum 42))])
+                         (#%datum 0)))])
+            (#%let ([v (#%prim call_cc f)])
+              (#%prim add1 v)))
+        '''
+        ast = self.to_ast(pgm)
+        self.assertEqual(self.intp.eval(ast), 43)
+
+    def test_call_cc_reenter(self):
+        pgm = '''
+          (#%let ([saved (#%prim box (#%datum #f))]
+                  [count (#%prim box (#%datum 0))])
+            (#%let ([v (#%prim call_cc (#%lambda (k)
+                                          (#%prim set_box saved k)
+                                          (#%datum 0)))])
+              (#%let ([n (#%prim unbox count)])
+                (#%let ([n1 (#%prim add1 n)])
+                  (#%prim set_box count n1)
+                  (#%let ([done (#%prim is_equal n1 (#%datum 3))])
+                    (#%if done
+                      v
+                      (#%let ([k (#%prim unbox saved)])
+                        (#%app k n1))))))))
+        '''
+        ast = self.to_ast(pgm)
+        self.assertEqual(self.intp.eval(ast), 2)
+
+    def test_call_site_callees(self):
+        an_ast = self.to_ast('''
+          (#%let ([f (#%lambda (x) (#%prim add1 x))]
+                  [g (#%lambda (x) (#%prim sub1 x))])
+            (#%let ([call (#%lambda (p v) (#%app p v))])
+              (#%let ([a (#%app call f (#%datum 10))]
+                      [b (#%app call g (#%datum 10))])
+                (#%let ([c (#%app call f b)])
+                  (#%prim plus a c)))))''')
+        self.assertEqual(self.intp.eval(an_ast), 21)
+
+    def test_shadow_equal_value(self):
+        an_ast = self.to_ast('''
+          (#%let ([x (#%datum 0)])
+            (#%let ([x (#%datum #f)])
+              (#%if x (#%datum 1) (#%datum 2))))''')
+        self.assertEqual(self.intp.eval(an_ast), 2)
+
+    def test_arity_mismatch(self):
+        an_ast = self.to_ast('''
+          (#%let ([f (#%lambda (x) x)]
+                  [h (#%lambda (x y) x)])
+            (#%let ([call (#%lambda (p v) (#%app p v))])
+              (#%let ([a (#%app call f (#%datum 1))])
+                (#%app call h a))))''')
+        with self.assertRaisesRegex(Exception, 'arity mismatch'):
+            self.intp.eval(an_ast)
+
+    def test_apply_non_procedure(self):
+        an_ast = self.to_ast('(#%let ([x (#%datum 1)]) (#%app x))')
+        with self.assertRaises(Exception):
+            self.intp.eval(an_ast)
+
+    def test_discarded_if(self):
+        an_ast = self.to_ast('''
+          (#%let ([x (#%datum 1)])
+            (#%if x (#%datum 1) (#%datum 2))
+            (#%datum 3))''')
+        self.assertEqual(self.intp.eval(an_ast), 3)
+
+    def test_discarded_unbound(self):
+        an_ast = self.to_ast('(#%begin nope (#%datum 1))')
+        with self.assertRaisesRegex(Exception, 'nope is not defined'):
+            self.intp.eval(an_ast)
+
+
+class TestRegisterInterpreter(TestInterpreter):
+    def setUp(self):
+        self.intp = RegisterInterpreter()
+
+
+class TestResolvedInterpreter(TestInterpreter):
+    def to_ast(self, a_string):
+        return resolve(super().to_ast(a_string))
+
+
+class TestOptimizedInterpreter(TestInterpreter):
+    def to_ast(self, a_string):
+        return optimize(super().to_ast(a_string))
+
+    @skip('the optimizer drops unused references')
+    def test_discarded_unbound(self):
+        pass
+
+
+class TestResolvedRegisterInterpreter(TestResolvedInterpreter):
+    def setUp(self):
+        self.intp = RegisterInterpreter()
+
+
+class TestCompiler(TestInterpreter):
+    def setUp(self):
+        self.intp = Compiler()
+
+    def test_call_cc_escape(self):
+        ast = self.to_ast('(#%prim call_cc (#%lambda (k) (#%datum 0)))')
+        with self.assertRaises(Exception):
+            self.intp.eval(ast)
+
+    @skip('the compiler does not support continuations')
+    def test_call_cc_reenter(self):
+        pass
+
+    @skip('the compiler does not support continuations')
+    def test_call_cc_let_reenter(self):
+        pass
+
+    def test_deep_recursion_limit(self):
+        # unlike Interpreter, non-tail calls use the Python stack
+        ast = self.to_ast(SUM_PGM.format(n=20000))
+        limit = sys.getrecursionlimit()
+        with self.assertRaisesRegex(Exception, 'call depth limit'):
+            self.intp.eval(ast)
+        self.assertEqual(sys.getrecursionlimit(), limit)
+        self.assertEqual(Interpreter().eval(ast), 200010000)
+
+    def test_recursion_limit_grows(self):
+        # the limit only grows as far as the calls nest, here 40 lets deep
+        inner = '(#%let ([x1 (#%app rec x0)]) (#%prim plus x x1))'
+        for i in range(40):
+            inner = f'(#%let ([y{i} (#%datum {i})]) {inner})'
+        pgm = SUM_PGM.format(n=3000).replace(
+            '(#%let ([x1 (#%app rec x0)])\n'
+            '                             (#%prim plus x x1))', inner)
+        self.assertIn('y39', pgm)
+        limit = sys.getrecursionlimit()
+        self.assertEqual(self.intp.eval(self.to_ast(SUM_PGM.format(n=100))), 5050)
+        self.assertEqual(self.intp.eval(self.to_ast(pgm)), 4501500)
+        self.assertEqual(sys.getrecursionlimit(), limit)
+
+    def test_compile_once(self):
+        ast = self.to_ast('(#%let ([x (#%datum 3)]) (#%prim add1 x))')
+        self.assertIs(self.intp.compile(ast), self.intp.compile(ast))
+        self.assertEqual(self.intp.eval(ast), 4)
+        self.assertEqual(self.intp.eval(ast), 4)
+
+
+class TestResolvedCompiler(TestCompiler):
+    def to_ast(self, a_string):
+        return resolve(super().to_ast(a_string))
+
+
+class TestPythonCompiler(TestCompiler):
+    def setUp(self):
+        self.intp = PythonCompiler()
+
+    def test_code_cache_bounded(self):
+        for i in range(codegen.code_cache_size + 10):
+            ast = self.to_ast(f'(#%prim add1 (#%datum {i}))')
+            self.assertEqual(self.intp.eval(ast), i + 1)
+        self.assertEqual(len(codegen._code_cache), codegen.code_cache_size)
+
+    def test_shadowed_capture(self):
+        ast = self.to_ast('''
+          (#%let ([x (#%datum 1)])
+            (#%let ([f (#%lambda () x)])
+              (#%let ([x (#%datum 2)])
+                (#%let ([y (#%app f)])
+                  (#%prim plus x y)))))''')
+        self.assertEqual(self.intp.eval(ast), 3)
+
+
+class TestLoweredCompiler(TestCompiler):
+    def to_ast(self, a_string):
+        return lower(resolve(super().to_ast(a_string)))
+
+
+class TestLoweredPythonCompiler(TestPythonCompiler):
+    def to_ast(self, a_string):
+        return lower(resolve(super().to_ast(a_string)))
+
+
+class TestLoweredInterpreter(TestInterpreter):
+    def to_ast(self, a_string):
+        return lower(resolve(optimize(super().to_ast(a_string))))
+
+    @skip('the optimizer drops unused references')
+    def test_discarded_unbound(self):
+        pass
+
+
+class TestLoweredRegisterInterpreter(TestLoweredInterpreter):
+    def setUp(self):
+        self.intp = RegisterInterpreter()
+
+
+class TestLoweredNamedInterpreter(TestInterpreter):
+    def to_ast(self, a_string):
+        return lower(super().to_ast(a_string))
+
+
+class TestHamtEnvInterpreter(TestInterpreter):
+    def setUp(self):
+        self.intp = Interpreter(local_env=HamtEnv)
+
+
+class TestHamtEnvRegisterInterpreter(TestInterpreter):
+    def setUp(self):
+        self.intp = RegisterInterpreter(local_env=HamtEnv)
+
+
+class TestLoweredHamtEnvInterpreter(TestLoweredNamedInterpreter):
+    def setUp(self):
+        self.intp = RegisterInterpreter(local_env=HamtEnv)
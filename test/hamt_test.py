@@ -1,74 +1,5 @@
+from vulcan.hamt import Hamt
 
-import pytest
-
-from vulcan.hamt import Hamt, SVector
-
-class TestSVector:
-    def test_bad_mask(self):
-        with pytest.raises(Exception):
-            SVector(0, [None])
-
-    def test_has_child(self):
-        sv0 = SVector(1, [None])
-        assert sv0.has_child(0)
-        assert not sv0.has_child(1)
-        assert 0 in sv0
-        assert 1 not in sv0
-
-        sv1 = SVector(2, [None])
-        assert not sv1.has_child(0)
-        assert sv1.has_child(1)
-
-
-    def test_child_index(self):
-        assert SVector(1, [None]).child_index(0) == 0
-        assert SVector(2, [None]).child_index(1) == 0
-        assert SVector(3, [None] * 2).child_index(0) == 0
-        assert SVector(3, [None] * 2).child_index(1) == 1
-
-    def test_ref(self):
-        assert SVector(3, [3,4])[0] == 3
-        assert SVector(3, [3,4])[1] == 4
-        assert SVector(3, [3,4])[2] == None
-        assert SVector(4, [5])[0] == None
-        assert SVector(4, [5])[1] == None
-        assert SVector(4, [5])[2] == 5
-
-    def test_update_empty_add(self):
-        sv0 = SVector(0,[])
-        sv1 = sv0.update(0, 1, [42])
-        assert sv1.mask == 1
-        assert sv1.slots == [42]
-
-    def test_update_replace(self):
-        sv0 = SVector(4,[3])
-        sv1 = sv0.update(4,4,[42])
-        assert sv1.mask == 4
-        assert sv1.slots == [42]
-
-    def test_update_copy(self):
-        sv0 = SVector(3, [41,42])
-        sv1 = sv0.update(0,0,[])
-        assert sv0.mask == sv1.mask
-        assert sv0.slots == sv1.slots
-
-    def test_update_remove_empty(self):
-        sv0 = SVector(1, [1])
-        sv1 = sv0.update(1,0,[])
-        assert sv1.mask == 0
-        assert sv1.slots == []
-
-    def test_update_remove_first(self):
-        sv0 = SVector(3, [1,2])
-        sv1 = sv0.update(1,0,[])
-        assert sv1.mask == 2
-        assert sv1.slots == [2]
-
-    def test_update_shift(self):
-        sv0 = SVector(3, [3, 4])
-        sv1 = sv0.update(3, 6, [3, 4])
-        assert sv1.mask == 6
-        assert sv1.slots == [3, 4]
 
 class O:
     def __init__(self, s, h):
@@ -79,7 +10,7 @@ class O:
         return (super().__hash__() << self.s) | self.h
 
 class TestHamt:
-    def setup(self):
+    def setup_method(self):
         self.h0 = Hamt()
         self.ka = O(8, 0x00)
         self.kb = O(8, 0x01)
@@ -216,3 +147,160 @@ class TestHamt:
         assert h4.lookup(self.ka, lambda: None, lambda k,v: v) == 0
         assert h4.lookup(self.kb, lambda: None, lambda k,v: v) == 1
         assert h4.lookup(self.kc, lambda: None, lambda k,v: v) == 2
+
+
+class C:
+    # every C has the same hash
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, C) and self.name == other.name
+
+    def __hash__(self):
+        return 7
+
+
+def depth(node):
+    if node.is_leaf:
+        return 0
+    children = node.content[2 * node.datamap.bit_count():]
+    return 1 + max((depth(c) for c in children), default=0)
+
+
+def get(h, k):
+    return h.lookup(k, lambda: None, lambda k,v: v)
+
+
+class TestHamtKeys:
+    def test_zero_hash(self):
+        h = Hamt().insert(0, 'a').insert(16, 'b').insert(256, 'c')
+        assert h.count() == 3
+        assert get(h, 0) == 'a'
+        assert get(h, 16) == 'b'
+        assert get(h, 256) == 'c'
+
+    def test_equal_hashes(self):
+        # hash(-1) == hash(-2) in CPython
+        h = Hamt().insert(-1, 'a').insert(-2, 'b')
+        assert h.count() == 2
+        assert get(h, -1) == 'a'
+        assert get(h, -2) == 'b'
+        h = h.remove(-1)
+        assert h.count() == 1
+        assert get(h, -1) is None
+        assert get(h, -2) == 'b'
+
+    def test_collisions(self):
+        keys = [C(i) for i in range(5)]
+        h = Hamt()
+        for i, k in enumerate(keys):
+            h = h.insert(k, i)
+        h = h.insert(keys[2], 'two').insert(keys[3], 3)
+        assert h.count() == 5
+        assert [get(h, k) for k in keys] == [0, 1, 'two', 3, 4]
+        assert get(h, C(9)) is None
+        assert h.remove(C(9)) is h
+        for k in keys:
+            h = h.remove(k)
+            assert get(h, k) is None
+        assert h.count() == 0
+
+    def test_many_ints(self):
+        n = 20000
+        h = Hamt()
+        for i in range(n):
+            h = h.insert(i, i * 2)
+        assert h.count() == n
+        assert all(get(h, i) == i * 2 for i in range(n))
+        assert get(h, n) is None
+        # log16(20000) is about 3.6, a few pairs share 6 hash digits
+        assert depth(h.root) <= 8
+        for i in range(0, n, 2):
+            h = h.remove(i)
+        assert h.count() == n // 2
+        assert get(h, 2) is None
+        assert get(h, 3) == 6
+
+    def test_replace_nested(self):
+        h = Hamt()
+        for i in range(100):
+            h = h.insert(i, i)
+        for i in range(100):
+            h = h.insert(i, -i)
+        assert h.count() == 100
+        assert all(get(h, i) == -i for i in range(100))
+
+
+class TestHamtBuilder:
+    def test_from_items(self):
+        n = 5000
+        h = Hamt.from_items((i, -i) for i in range(n))
+        assert h.count() == n
+        assert all(get(h, i) == -i for i in range(n))
+        assert get(h, n) is None
+
+    def test_from_dict(self):
+        h = Hamt.from_items({'a': 1, 'b': 2})
+        assert h.count() == 2
+        assert get(h, 'b') == 2
+
+    def test_update_many_persistent(self):
+        h1 = Hamt.from_items((i, i) for i in range(100))
+        h2 = h1.update_many((i, 'x') for i in range(50, 150))
+        assert h1.count() == 100
+        assert h2.count() == 150
+        assert all(get(h1, i) == i for i in range(100))
+        assert get(h1, 120) is None
+        assert [get(h2, i) for i in (0, 49, 50, 149)] == [0, 49, 'x', 'x']
+
+    def test_matches_insert(self):
+        keys = list(range(0, 3000, 7)) + [-1, -2] + [C(i) for i in range(3)]
+        h1 = Hamt()
+        for k in keys:
+            h1 = h1.insert(k, str(k))
+        h2 = Hamt.from_items((k, str(k)) for k in keys)
+        assert h1.count() == h2.count() == len(keys)
+        assert all(get(h2, k) == str(k) for k in keys)
+        h3 = h2.insert(7, 'seven').remove(14)
+        assert get(h3, 7) == 'seven'
+        assert get(h3, 14) is None
+        assert get(h2, 7) == '7'
+        assert get(h2, 14) == '14'
+
+    def test_transient_frozen(self):
+        builder = Hamt().transient()
+        builder.insert('a', 1).insert('b', 2)
+        h1 = builder.freeze()
+        builder.insert('c', 3)
+        h2 = builder.freeze()
+        assert h1.count() == 2
+        assert get(h1, 'c') is None
+        assert h2.count() == 3
+        assert get(h2, 'c') == 3
+
+
+class TestHamtLayout:
+    def test_canonical(self):
+        keys = list(range(500)) + [-1, -2] + [C(i) for i in range(3)]
+        h1 = Hamt.from_items((k, 0) for k in keys)
+        h2 = Hamt()
+        for k in reversed(keys + list(range(500, 600))):
+            h2 = h2.insert(k, 0)
+        for k in range(500, 600):
+            h2 = h2.remove(k)
+        assert h1 == h2
+        assert depth(h1.root) == depth(h2.root)
+        assert h1 != h2.insert(0, 1)
+        assert h1 != h2.remove(C(1))
+
+    def test_remove_inlines(self):
+        h = Hamt.from_items((i, i) for i in range(200))
+        for i in range(1, 200):
+            h = h.remove(i)
+        assert h.root.single() == (0, 0)
+
+    def test_items(self):
+        h = Hamt.from_items((i, -i) for i in range(300))
+        assert len(h) == 300
+        assert sorted(h.items()) == [(i, -i) for i in range(300)]
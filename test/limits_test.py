@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.bench import FIB_PGM
+from vulcan.limits import AccountingInterpreter, Limits, ResourceLimitExceeded
+from vulcan.lower import lower
+from vulcan.optimize import optimize
+from vulcan.read import read_all
+from vulcan.resolve import resolve
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+# allocates a box per iteration until n reaches zero
+BOX_LOOP = '''
+  (#%letrec ([loop (#%lambda (n)
+                     (#%let ([z (#%prim is_zero n)])
+                       (#%if z
+                         (#%datum 0)
+                         (#%let ([b (#%prim box n)]
+                                 [m (#%prim sub1 n)])
+                           (#%app loop m)))))])
+    (#%app loop (#%datum 100)))
+'''
+
+
+class TestAccounting(TestCase):
+    def test_counts(self):
+        intp = AccountingInterpreter()
+        self.assertEqual(intp.eval(to_ast(BOX_LOOP)), 0)
+        usage = intp.usage.as_dict()
+        self.assertEqual(usage['box'], 100)
+        self.assertEqual(usage['closure'], 1)
+        # a let env per binding form and one per call
+        self.assertEqual(usage['env'], 1 + 101 * 2 + 100)
+        self.assertEqual(usage['objects'], usage['box'] + usage['closure'] +
+                         usage['env'] + usage['frame'])
+        self.assertGreater(usage['bytes'], 0)
+        self.assertEqual(usage['depth'], 0)
+
+    def test_lowered_boxes(self):
+        intp = AccountingInterpreter()
+        ast = lower(resolve(optimize(to_ast(BOX_LOOP))))
+        self.assertEqual(intp.eval(ast), 0)
+        self.assertEqual(intp.usage.counts['box'], 100)
+
+    def test_object_limit(self):
+        intp = AccountingInterpreter(limits=Limits(max_objects=200))
+        with self.assertRaises(ResourceLimitExceeded) as cm:
+            intp.eval(to_ast(BOX_LOOP))
+        self.assertEqual(cm.exception.resource, 'objects')
+        self.assertEqual(cm.exception.usage['objects'], 201)
+        self.assertTrue(intp.halt)
+
+    def test_byte_limit(self):
+        intp = AccountingInterpreter(limits=Limits(max_bytes=10000))
+        with self.assertRaises(ResourceLimitExceeded) as cm:
+            intp.eval(to_ast(BOX_LOOP))
+        self.assertEqual(cm.exception.resource, 'bytes')
+        self.assertLessEqual(cm.exception.usage['bytes'] - 10000, 1000)
+
+    def test_depth_limit(self):
+        intp = AccountingInterpreter(limits=Limits(max_depth=10))
+        with self.assertRaises(ResourceLimitExceeded) as cm:
+            intp.eval(to_ast(FIB_PGM))
+        self.assertEqual(cm.exception.resource, 'depth')
+        self.assertEqual(cm.exception.usage['max_depth'], 11)
+
+    def test_within_limits(self):
+        limits = Limits(max_objects=100000, max_depth=20)
+        intp = AccountingInterpreter(limits=limits)
+        self.assertEqual(intp.eval(to_ast(FIB_PGM)), 987)
+        self.assertEqual(intp.usage.max_depth, 17)
+
+    def test_usage_per_run(self):
+        intp = AccountingInterpreter(limits=Limits(max_objects=1000))
+        self.assertEqual(intp.eval(to_ast(BOX_LOOP)), 0)
+        objects = intp.usage.objects
+        self.assertEqual(intp.eval(to_ast(BOX_LOOP)), 0)
+        self.assertEqual(intp.usage.objects, objects)
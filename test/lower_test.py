@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from vulcan.ast import LetAppExpr, LetPrimExpr, PrimIfExpr, parse_sexp_seq
+from vulcan.bench import FIB_PGM, count_steps
+from vulcan.lower import lower
+from vulcan.read import read_all
+
+
+class TestLower(TestCase):
+    def to_ast(self, a_string):
+        return parse_sexp_seq(read_all(a_string))
+
+    def test_shapes(self):
+        ast = lower(self.to_ast('''
+          (#%lambda (f a)
+            (#%let ([t (#%prim is_zero a)])
+              (#%if t
+                (#%let ([x (#%app f a)])
+                  (#%let ([y (#%prim add1 x)] [z a])
+                    y))
+                a)))'''))
+        primif = ast.body
+        self.assertIsInstance(primif, PrimIfExpr)
+        self.assertIsInstance(primif.conseq, LetAppExpr)
+        self.assertIsInstance(primif.conseq.body, LetPrimExpr)
+
+    def test_call_cc_not_inlined(self):
+        ast = lower(self.to_ast('''
+          (#%let ([v (#%prim call_cc (#%lambda (k) (#%datum 1)))])
+            v)'''))
+        self.assertNotIsInstance(ast, LetPrimExpr)
+
+    def test_fewer_steps(self):
+        ast = self.to_ast(FIB_PGM)
+        self.assertLess(count_steps(lower(ast)) * 2, count_steps(ast))
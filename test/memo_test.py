@@ -0,0 +1,176 @@
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.bench import FIB_PGM
+from vulcan.eval import Interpreter, RegisterInterpreter
+from vulcan.lower import lower
+from vulcan.memo import MemoCache, mark_pure
+from vulcan.optimize import optimize
+from vulcan.read import read_all
+from vulcan.resolve import resolve
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+def lambdas(ast, found=None):
+    # every LambdaExpr in ast, in source order
+    if found is None:
+        found = []
+    if hasattr(ast, 'args') and hasattr(ast, 'body'):
+        found.append(ast)
+    for field in ast.fields:
+        value = getattr(ast, field)
+        items = value if isinstance(value, (list, tuple)) else [value]
+        for item in items:
+            if hasattr(item, 'fields'):
+                lambdas(item, found)
+    return found
+
+
+class TestPurity(TestCase):
+    def purity(self, a_string):
+        ast = mark_pure(to_ast(a_string))
+        return [a_lambda.pure for a_lambda in lambdas(ast)]
+
+    def test_pure_prims(self):
+        self.assertEqual(
+            self.purity('(#%lambda (x) (#%prim plus x (#%datum 1)))'),
+            [True])
+
+    def test_box_effect(self):
+        self.assertEqual(
+            self.purity('(#%lambda (b) (#%prim set_box b (#%datum 1)))'),
+            [False])
+
+    def test_unknown_call(self):
+        self.assertEqual(self.purity('(#%lambda (f) (#%app f (#%datum 1)))'),
+                         [False])
+
+    def test_known_call(self):
+        self.assertEqual(self.purity('''
+          (#%let ([inc (#%lambda (x) (#%prim add1 x))])
+            (#%lambda (y) (#%app inc y)))'''), [True, True])
+
+    def test_shadowed_call(self):
+        self.assertEqual(self.purity('''
+          (#%let ([inc (#%lambda (x) (#%prim add1 x))])
+            (#%lambda (inc) (#%app inc (#%datum 1))))'''), [True, False])
+
+    def test_letrec(self):
+        self.assertEqual(self.purity('''
+          (#%letrec ([even (#%lambda (n)
+                             (#%let ([z (#%prim is_zero n)])
+                               (#%if z (#%datum #t)
+                                 (#%let ([m (#%prim sub1 n)])
+                                   (#%app odd m)))))]
+                     [odd (#%lambda (n)
+                            (#%let ([z (#%prim is_zero n)])
+                              (#%if z (#%datum #f)
+                                (#%let ([m (#%prim sub1 n)])
+                                  (#%app even m)))))])
+            even)'''), [True, True])
+
+    def test_letrec_impure_member(self):
+        self.assertEqual(self.purity('''
+          (#%letrec ([f (#%lambda (n) (#%app g n))]
+                     [g (#%lambda (n) (#%prim box n))])
+            f)'''), [False, False])
+
+
+class TestMemoCache(TestCase):
+    def test_lru(self):
+        cache = MemoCache(max_size=2)
+        cache.store('a', 1)
+        cache.store('b', 2)
+        self.assertEqual(cache.lookup('a'), 1)
+        cache.store('c', 3)
+        self.assertIsNone(cache.lookup('b'))
+        self.assertEqual(cache.lookup('c'), 3)
+        self.assertEqual(cache.stats(), {'size': 2, 'max_size': 2, 'hits': 2,
+                                         'misses': 1, 'evictions': 1})
+
+
+class TestMemoInterpreter(TestCase):
+    make_interpreter = Interpreter
+
+    def prepare(self, ast):
+        return mark_pure(resolve(optimize(ast)))
+
+    def test_fib(self):
+        ast = self.prepare(to_ast(FIB_PGM))
+        memo = MemoCache()
+        intp = self.make_interpreter(memo=memo)
+        self.assertEqual(intp.eval(ast), 987)
+        stats = memo.stats()
+        # one miss per n, fib (n - 2) is a hit for n > 2
+        self.assertEqual(stats['misses'], 17)
+        self.assertEqual(stats['hits'], 14)
+
+    def test_small_cache(self):
+        ast = self.prepare(to_ast(FIB_PGM))
+        memo = MemoCache(max_size=1)
+        intp = self.make_interpreter(memo=memo)
+        self.assertEqual(intp.eval(ast), 987)
+        self.assertEqual(memo.stats()['size'], 1)
+        self.assertGreater(memo.stats()['evictions'], 0)
+
+    def test_impure_not_cached(self):
+        ast = self.prepare(to_ast('''
+          (#%let ([b (#%prim box (#%datum 0))])
+            (#%let ([bump (#%lambda (x)
+                            (#%let ([v (#%prim unbox b)])
+                              (#%let ([v1 (#%prim plus v x)])
+                                (#%let ([_ (#%prim set_box b v1)])
+                                  v1))))])
+              (#%let ([p (#%app bump (#%datum 1))])
+                (#%app bump (#%datum 1)))))'''))
+        memo = MemoCache()
+        intp = self.make_interpreter(memo=memo)
+        self.assertEqual(intp.eval(ast), 2)
+        self.assertEqual(memo.stats()['misses'], 0)
+
+    def test_false_and_zero(self):
+        ast = self.prepare(to_ast('''
+          (#%let ([id (#%lambda (x) x)])
+            (#%let ([a (#%app id (#%datum #f))])
+              (#%let ([b (#%app id (#%datum 0))])
+                (#%if b (#%datum 1) (#%datum 2)))))'''))
+        memo = MemoCache()
+        intp = self.make_interpreter(memo=memo)
+        self.assertEqual(intp.eval(ast), 1)
+        self.assertEqual(memo.stats()['misses'], 2)
+
+    def test_unhashable_arg(self):
+        ast = self.prepare(to_ast('''
+          (#%let ([f (#%lambda (x) (#%prim is_equal x x))])
+            (#%app f (#%datum (1 2))))'''))
+        memo = MemoCache()
+        intp = self.make_interpreter(memo=memo)
+        self.assertIs(intp.eval(ast), True)
+        self.assertEqual(memo.stats()['size'], 0)
+
+    def test_copy_rebound(self):
+        for pgm in ('''
+              (#%app (#%lambda (x)
+                       (#%let ([y x] [x (#%prim add1 x)]) y))
+                     (#%datum 5))''', '''
+              (#%app (#%lambda (x)
+                       (#%let ([y x])
+                         (#%app (#%lambda (x) y) (#%datum 100))))
+                     (#%datum 5))'''):
+            ast = self.prepare(to_ast(pgm))
+            intp = self.make_interpreter(memo=MemoCache())
+            self.assertEqual(intp.eval(ast), 5)
+
+
+class TestMemoRegister(TestMemoInterpreter):
+    make_interpreter = RegisterInterpreter
+
+
+class TestMemoLowered(TestMemoInterpreter):
+    make_interpreter = RegisterInterpreter
+
+    def prepare(self, ast):
+        return mark_pure(lower(resolve(optimize(ast))))
@@ -0,0 +1,117 @@
+from unittest import TestCase
+
+from vulcan.ast import (DatumExpr, LetExpr, LetRecExpr, PrimAppExpr, RefExpr,
+                        parse_sexp_seq)
+from vulcan.eval import EmptyEnv, Interpreter
+from vulcan.letrec import eliminate_boxes
+from vulcan.optimize import optimize
+from vulcan.read import read_all
+
+
+class TestOptimize(TestCase):
+    def to_ast(self, a_string):
+        return optimize(parse_sexp_seq(read_all(a_string)))
+
+    def test_fold(self):
+        ast = self.to_ast('''
+          (#%let ([x (#%datum 3)]
+                  [y (#%datum 4)])
+            (#%let ([z (#%prim plus x y)])
+              (#%prim mult z z)))''')
+        self.assertIsInstance(ast, DatumExpr)
+        self.assertEqual(ast.value, 49)
+
+    def test_if(self):
+        ast = self.to_ast('''
+          (#%let ([x (#%datum 0)])
+            (#%let ([t (#%prim is_zero x)])
+              (#%if t (#%datum 1) (#%datum 2))))''')
+        self.assertIsInstance(ast, DatumExpr)
+        self.assertEqual(ast.value, 1)
+
+    def test_copy_propagation(self):
+        ast = self.to_ast('''
+          (#%lambda (a)
+            (#%let ([b a])
+              (#%prim add1 b)))''')
+        self.assertIsInstance(ast.body, PrimAppExpr)
+        self.assertEqual(ast.body.rands[0].name, 'a')
+
+    def test_copy_not_captured(self):
+        ast = self.to_ast('''
+          (#%lambda (a)
+            (#%let ([b a])
+              (#%lambda (a) (#%prim plus a b))))''')
+        self.assertIsInstance(ast.body, LetExpr)
+        closure = Interpreter().eval(ast)
+        intp = Interpreter(EmptyEnv().extend(['f'], [closure]))
+        app = parse_sexp_seq(read_all('''
+          (#%let ([g (#%app f (#%datum 10))])
+            (#%app g (#%datum 1)))'''))
+        self.assertEqual(intp.eval(app), 11)
+
+    def test_dead_binding(self):
+        ast = self.to_ast('''
+          (#%lambda (a)
+            (#%let ([unused (#%prim add1 a)]
+                    [effect (#%prim box a)])
+              a))''')
+        self.assertEqual(ast.body.b_vars, ['effect'])
+        self.assertIsInstance(ast.body.body, RefExpr)
+
+    def test_fold_error_left(self):
+        ast = self.to_ast('(#%prim add1 (#%datum #undefined))')
+        self.assertIsInstance(ast, PrimAppExpr)
+
+
+class TestEliminateBoxes(TestCase):
+    def to_ast(self, a_string):
+        return eliminate_boxes(parse_sexp_seq(read_all(a_string)))
+
+    def test_factorial(self):
+        ast = self.to_ast('''
+          (#%let ([factorial-loc (#%prim box (#%datum #undefined))])
+            (#%prim set_box
+                       factorial-loc
+                       (#%lambda (x)
+                         (#%let ([is_zero-result (#%prim is_zero x)])
+                           (#%if is_zero-result
+                                 (#%datum 1)
+                                 (#%let ([rec (#%prim unbox factorial-loc)]
+                                         [x0  (#%prim sub1 x)])
+                                   (#%let ([x1 (#%app rec x0)])
+                                     (#%prim mult x x1)))))))
+            (#%let ([factorial (#%prim unbox factorial-loc)])
+              (#%app factorial (#%datum 10))))''')
+        self.assertIsInstance(ast, LetRecExpr)
+        self.assertEqual(ast.b_vars, ['factorial-loc'])
+        rec = ast.b_exprs[0].body.body.alter.b_exprs[0]
+        self.assertIsInstance(rec, RefExpr)
+        self.assertEqual(Interpreter().eval(ast), 3628800)
+
+    def test_escaping_box_kept(self):
+        ast = self.to_ast('''
+          (#%let ([b (#%prim box (#%datum #undefined))])
+            (#%prim set_box b (#%lambda () (#%datum 1)))
+            b)''')
+        self.assertIsInstance(ast, LetExpr)
+
+    def test_second_set_kept(self):
+        ast = self.to_ast('''
+          (#%let ([b (#%prim box (#%datum #undefined))])
+            (#%prim set_box b (#%lambda () (#%datum 1)))
+            (#%prim set_box b (#%lambda () (#%datum 2)))
+            (#%let ([f (#%prim unbox b)])
+              (#%app f)))''')
+        self.assertIsInstance(ast, LetExpr)
+        self.assertEqual(Interpreter().eval(ast), 2)
+
+    def test_shadowed_unbox(self):
+        ast = self.to_ast('''
+          (#%let ([b (#%prim box (#%datum #undefined))])
+            (#%prim set_box b (#%lambda () (#%datum 1)))
+            (#%let ([b (#%prim box (#%datum 5))])
+              (#%prim unbox b)))''')
+        self.assertIsInstance(ast, LetRecExpr)
+        self.assertIsInstance(ast.body.body, PrimAppExpr)
+        self.assertEqual(Interpreter().eval(ast), 5)
@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.prim import PRIMITIVES, Primitives
+from vulcan.read import read_all
+
+
+class TestPrimRegistry(TestCase):
+    def test_metadata(self):
+        plus = PRIMITIVES.lookup('plus')
+        self.assertEqual(plus.arity, 2)
+        self.assertTrue(plus.pure)
+        self.assertIs(plus.fn, Primitives.prim_plus)
+        set_box = PRIMITIVES.lookup('set_box')
+        self.assertFalse(set_box.pure)
+        self.assertTrue(PRIMITIVES.lookup('call_cc').control)
+
+    def test_call_cc_unsupported(self):
+        with self.assertRaisesRegex(Exception, 'not supported by Primitives'):
+            Primitives().prim_call_cc(None)
+
+    def test_bound_at_parse(self):
+        ast = parse_sexp_seq(read_all('(#%prim add1 (#%datum 1))'))
+        self.assertIs(ast.prim, PRIMITIVES.lookup('add1'))
+
+    def test_unknown(self):
+        with self.assertRaises(Exception):
+            parse_sexp_seq(read_all('(#%prim nope (#%datum 1))'))
+
+    def test_arity(self):
+        with self.assertRaises(Exception):
+            parse_sexp_seq(read_all('(#%prim plus (#%datum 1))'))
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.bench import FIB_PGM
+from vulcan.eval import Suspended
+from vulcan.lower import lower
+from vulcan.optimize import optimize
+from vulcan.profiler import ProfilingInterpreter, profile
+from vulcan.read import read_all
+from vulcan.resolve import resolve
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+class TestProfiler(TestCase):
+    def test_fib(self):
+        value, prof = profile(to_ast(FIB_PGM))
+        self.assertEqual(value, 987)
+        self.assertEqual(list(prof.calls.values()), [3193])
+        self.assertEqual(prof.prims['plus'][0], 1596)
+        self.assertEqual(prof.prims['box'][0], 1)
+        self.assertEqual(prof.max_depth, 17)
+        steps = sum(count for count, _ in prof.nodes.values())
+        self.assertEqual(steps, 47056)
+
+    def test_lowered(self):
+        ast = lower(resolve(optimize(to_ast(FIB_PGM))))
+        value, prof = profile(ast)
+        self.assertEqual(value, 987)
+        self.assertEqual(list(prof.calls.values()), [3193])
+        self.assertEqual(prof.prims['sub1'][0], 3192)
+
+    def test_report(self):
+        _, prof = profile(to_ast(FIB_PGM))
+        report = prof.report(limit=3)
+        self.assertIn('max stack depth 17', report)
+        self.assertIn('lambda (n)#', report)
+        nodes = report.split('nodes:\n')[1].split('\n\n')[0]
+        self.assertEqual(len(nodes.splitlines()), 3)
+
+    def test_flamegraph(self):
+        _, prof = profile(to_ast(FIB_PGM))
+        for line in prof.flamegraph().splitlines():
+            stack, micros = line.rsplit(' ', 1)
+            self.assertEqual(stack.split(';')[0], 'KHalt')
+            self.assertGreaterEqual(int(micros), 0)
+
+    def test_fuel(self):
+        intp = ProfilingInterpreter()
+        intp.load(to_ast(FIB_PGM))
+        result = intp.run(100)
+        self.assertIsInstance(result, Suspended)
+        self.assertEqual(result.resume(), 987)
+        self.assertEqual(list(intp.profile.calls.values()), [3193])
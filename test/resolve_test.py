@@ -0,0 +1,91 @@
+from unittest import TestCase
+
+from vulcan.ast import GlobalRefExpr, LexRefExpr, parse_sexp_seq
+from vulcan.eval import EmptyEnv, Interpreter
+from vulcan.read import read_all
+from vulcan.resolve import free_vars, resolve
+from vulcan.type import undefined
+
+
+class TestResolve(TestCase):
+    def to_ast(self, a_string):
+        return resolve(parse_sexp_seq(read_all(a_string)))
+
+    def test_addresses(self):
+        ast = self.to_ast('''
+          (#%let ([x (#%datum 1)] [y (#%datum 2)])
+            (#%let ([z (#%datum 3)])
+              (#%lambda (a) (#%prim plus y a))))''')
+        a_lambda = ast.body.body.body
+        y_ref, a_ref = a_lambda.body.rands
+        self.assertIsInstance(y_ref, LexRefExpr)
+        self.assertEqual((y_ref.depth, y_ref.slot), (1, 0))
+        self.assertEqual((a_ref.depth, a_ref.slot), (0, 0))
+        free_y = a_lambda.free_refs[0]
+        self.assertEqual((free_y.depth, free_y.slot), (0, 1))
+        self.assertEqual(ast.let_vars, ['x', 'y', 'z'])
+        self.assertEqual((ast.body.slot, ast.body.body.slot), (0, 2))
+
+    def test_shadowing(self):
+        ast = self.to_ast('''
+          (#%let ([x (#%datum 1)])
+            (#%let ([x (#%datum 2)] [w x])
+              x))''')
+        inner = ast.body.body
+        outer_x = inner.b_exprs[1]
+        self.assertEqual((outer_x.depth, outer_x.slot), (0, 0))
+        self.assertEqual((inner.body.depth, inner.body.slot), (0, 1))
+        self.assertEqual(Interpreter().eval(ast), 2)
+
+    def test_let_depth(self):
+        # lets bind slots in the lambda's frame, only lambdas add depth
+        ast = self.to_ast('''
+          (#%lambda (a)
+            (#%let ([b (#%datum 1)])
+              (#%let ([c (#%datum 2)])
+                (#%let ([d (#%datum 3)])
+                  (#%prim plus a d)))))''')
+        a_lambda = ast.body
+        a_ref, d_ref = a_lambda.body.body.body.body.rands
+        self.assertEqual((a_ref.depth, a_ref.slot), (0, 0))
+        self.assertEqual((d_ref.depth, d_ref.slot), (0, 3))
+        self.assertEqual(a_lambda.let_vars, ['b', 'c', 'd'])
+        closure = Interpreter().eval(ast)
+        self.assertEqual(closure.env.enter(a_lambda, [1]).vals,
+                         [1, undefined, undefined, undefined])
+
+    def test_sibling_lets(self):
+        # branches share the frame but not each other's names
+        ast = self.to_ast('''
+          (#%let ([t (#%datum #f)])
+            (#%if t
+              (#%let ([y (#%datum 1)]) y)
+              (#%let ([z (#%datum 2)]) (#%prim plus z y))))''')
+        alter = ast.body.body.alter
+        z_ref, y_ref = alter.body.rands
+        self.assertEqual((z_ref.depth, z_ref.slot), (0, 2))
+        self.assertIsInstance(y_ref, GlobalRefExpr)
+        intp = Interpreter(EmptyEnv().extend(['y'], [40]))
+        self.assertEqual(intp.eval(ast), 42)
+
+    def test_global(self):
+        ast = self.to_ast('(#%prim add1 g)')
+        self.assertIsInstance(ast.body.rands[0], GlobalRefExpr)
+        intp = Interpreter(EmptyEnv().extend(['g'], [41]))
+        self.assertEqual(intp.eval(ast), 42)
+
+    def test_free_vars(self):
+        ast = parse_sexp_seq(read_all('''
+          (#%let ([x (#%datum 1)])
+            (#%lambda (a) (#%prim plus y x) (#%lambda (b) (#%app a b z))))'''))
+        self.assertEqual(free_vars(ast), ['y', 'z'])
+        self.assertEqual(free_vars(ast.body.body, ['a']), ['y', 'x', 'z'])
+
+    def test_flat_closure(self):
+        ast = self.to_ast('''
+          (#%let ([x (#%datum 1)] [y (#%datum 2)] [z (#%datum 3)])
+            (#%let ([w (#%datum 4)])
+              (#%lambda (a) (#%prim plus z a))))''')
+        closure = Interpreter().eval(ast)
+        self.assertEqual(closure.env.vars, ['z'])
+        self.assertEqual(closure.env.vals, [3])
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.bench import LOOP_PGM, SUM_PGM
+from vulcan.eval import Interpreter, RegisterInterpreter, Suspended
+from vulcan.read import read_all
+from vulcan.sched import Scheduler
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+class TestFuel(TestCase):
+    def check_resume(self, intp):
+        ast = to_ast(SUM_PGM)
+        result = intp.eval(ast, max_steps=100)
+        self.assertIsInstance(result, Suspended)
+        slices = 1
+        while isinstance(result, Suspended):
+            result = result.resume(max_steps=100)
+            slices += 1
+        self.assertEqual(result, 2001000)
+        self.assertGreater(slices, 10)
+
+    def test_resume(self):
+        self.check_resume(Interpreter())
+
+    def test_resume_register(self):
+        self.check_resume(RegisterInterpreter())
+
+    def test_mixed_resume(self):
+        intp = RegisterInterpreter()
+        result = intp.eval(to_ast(SUM_PGM), max_steps=500)
+        self.assertIsInstance(result, Suspended)
+        # the suspended registers are plain machine state
+        self.assertEqual(Interpreter.run(intp), 2001000)
+
+
+class TestScheduler(TestCase):
+    def test_round_robin(self):
+        sched = Scheduler(quantum=200)
+        slow = sched.spawn(to_ast(LOOP_PGM), 'slow')
+        fast = sched.spawn(to_ast('(#%prim plus (#%datum 1) (#%datum 2))'), 'fast')
+        bad = sched.spawn(to_ast('(#%app (#%datum 1))'), 'bad')
+        finished = sched.run()
+        self.assertEqual([t.name for t in finished], ['fast', 'bad', 'slow'])
+        self.assertEqual(fast.value, 3)
+        self.assertEqual(slow.value, 12502500)
+        self.assertIsNotNone(bad.error)
+        self.assertGreater(slow.steps, 0)
+
+    def test_steps(self):
+        for make_interpreter in (Interpreter, RegisterInterpreter):
+            intp = make_interpreter()
+            intp.eval(to_ast(SUM_PGM))
+            total = intp.last_steps
+            sched = Scheduler(quantum=300, make_interpreter=make_interpreter)
+            task = sched.spawn(to_ast(SUM_PGM))
+            sched.run()
+            self.assertEqual(task.value, 2001000)
+            self.assertNotEqual(total % 300, 0)
+            self.assertEqual(task.steps, total)
+
+    def test_steps_on_error(self):
+        sched = Scheduler(quantum=300)
+        task = sched.spawn(to_ast('(#%let ([x (#%datum 1)]) (#%app x))'))
+        sched.run()
+        self.assertIsNotNone(task.error)
+        self.assertGreater(task.steps, 0)
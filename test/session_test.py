@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.read import read_all
+from vulcan.session import Session
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+PRELUDE = [
+    ('double', to_ast('(#%lambda (x) (#%prim plus x x))')),
+    ('fact', to_ast('''
+      (#%letrec ([fact (#%lambda (n)
+                         (#%let ([z (#%prim is_zero n)])
+                           (#%if z
+                             (#%datum 1)
+                             (#%let ([n1 (#%prim sub1 n)])
+                               (#%let ([r (#%app fact n1)])
+                                 (#%prim mult n r))))))])
+        fact)''')),
+    ('scale', to_ast('(#%datum 3)')),
+    ('scaled', to_ast('(#%lambda (x) (#%prim mult x scale))')),
+]
+
+
+class TestSession(TestCase):
+    def setUp(self):
+        self.session = Session()
+        self.session.define_all(PRELUDE)
+
+    def test_use_prelude(self):
+        ast = to_ast('''
+          (#%let ([a (#%app fact (#%datum 5))])
+            (#%app double a))''')
+        self.assertEqual(self.session.eval(ast), 240)
+        self.assertEqual(self.session.eval(ast), 240)
+
+    def test_fork(self):
+        fork = self.session.fork()
+        fork.define('scale', to_ast('(#%datum 10)'))
+        fork.define('extra', to_ast('(#%datum 1)'))
+        ast = to_ast('(#%app scaled (#%datum 2))')
+        self.assertEqual(fork.eval(ast), 20)
+        self.assertEqual(self.session.eval(ast), 6)
+        with self.assertRaises(Exception):
+            self.session.eval(to_ast('extra'))
+
+    def test_undefined(self):
+        with self.assertRaises(Exception):
+            self.session.eval(to_ast('(#%app nope)'))
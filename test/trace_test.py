@@ -0,0 +1,114 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from vulcan.ast import parse_sexp_seq
+from vulcan.bench import FIB_PGM
+from vulcan.checkpoint import checkpoint, restore
+from vulcan.read import read_all
+from vulcan.trace import (APPLY, DOING, DONE, PUSH_K, RET, TraceBuffer,
+                          TracingInterpreter, TracingRegisterInterpreter,
+                          load_trace)
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+class TestTraceBuffer(TestCase):
+    def test_wrap(self):
+        trace = TraceBuffer(capacity=3)
+        for i in range(5):
+            trace.append(i, 0, DONE, 1)
+        self.assertEqual(len(trace), 3)
+        self.assertEqual([r[0] for r in trace.records()], [2, 3, 4])
+
+
+class TestTracingInterpreter(TestCase):
+    make_interpreter = TracingInterpreter
+
+    def test_transitions(self):
+        intp = self.make_interpreter(capacity=64)
+        ast = to_ast('''
+          (#%let ([f (#%lambda (x) (#%prim add1 x))])
+            (#%let ([y (#%app f (#%datum 1))])
+              y))''')
+        self.assertEqual(intp.eval(ast), 2)
+        kinds = [r[2] for r in intp.trace.records()]
+        self.assertEqual(kinds[:2], [PUSH_K, DOING])
+        self.assertIn(APPLY, kinds)
+        self.assertEqual(kinds.count(PUSH_K), kinds.count(RET))
+        # halting returns from the bottom frame
+        records = list(intp.trace.records())
+        self.assertEqual(records[0][3], 1)
+        self.assertEqual(records[-1][3], 0)
+
+    def test_bounded(self):
+        intp = self.make_interpreter(capacity=100)
+        self.assertEqual(intp.eval(to_ast(FIB_PGM)), 987)
+        records = list(intp.trace.records())
+        self.assertEqual(len(records), 100)
+        self.assertGreater(intp.trace.written, 100)
+        steps = [r[0] for r in records]
+        self.assertEqual(steps, sorted(steps))
+        self.assertEqual(steps[-1], intp.steps)
+
+    def test_dump_on_error(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.bin')
+            intp = self.make_interpreter(capacity=16, dump_path=path)
+            ast = to_ast('''
+              (#%let ([f (#%lambda (x) x)])
+                (#%app f (#%datum 1) (#%datum 2)))''')
+            with self.assertRaises(Exception):
+                intp.eval(ast)
+            records = load_trace(path)
+        self.assertEqual(records, list(intp.trace.records()))
+        self.assertEqual(records[-1][2], APPLY)
+        self.assertEqual(intp.nodes[records[-1][1]].__class__.__name__,
+                         'AppExpr')
+
+    def test_node_ids(self):
+        ast = to_ast(FIB_PGM)
+        intp = self.make_interpreter()
+        intp.eval(ast)
+        ids = dict(intp.nodes)
+        self.assertEqual(intp.nodes[ast.trace_id], ast)
+        intp.eval(ast)
+        self.assertEqual(intp.nodes, ids)
+        copy = restore(checkpoint(intp))
+        for i, node in copy.nodes.items():
+            self.assertEqual(node.trace_id, i)
+
+    def test_continuation_depth(self):
+        intp = self.make_interpreter()
+        ast = to_ast('''
+          (#%let ([a (#%prim call_cc (#%lambda (k)
+                                       (#%let ([b (#%app k (#%datum 1))])
+                                         b)))])
+            (#%prim add1 a))''')
+        self.assertEqual(intp.eval(ast), 2)
+        records = list(intp.trace.records())
+        self.assertEqual(records[-1][3], 0)
+        self.assertTrue(all(r[3] >= 0 for r in records))
+
+
+class TestTracingRegisterInterpreter(TestTracingInterpreter):
+    make_interpreter = TracingRegisterInterpreter
+
+    def test_transitions(self):
+        intp = self.make_interpreter(capacity=64)
+        ast = to_ast('''
+          (#%let ([f (#%lambda (x) (#%prim add1 x))])
+            (#%let ([y (#%app f (#%datum 1))])
+              y))''')
+        self.assertEqual(intp.eval(ast), 2)
+        records = list(intp.trace.records())
+        kinds = [r[2] for r in records]
+        # one doing, apply or ret record per step, push_k on top
+        self.assertEqual(len(kinds) - kinds.count(PUSH_K), intp.steps)
+        self.assertEqual(kinds[0], DOING)
+        self.assertIn(APPLY, kinds)
+        self.assertEqual(kinds.count(PUSH_K) + 1, kinds.count(RET))
+        self.assertEqual(records[0][3], 1)
+        self.assertEqual(records[-1][3], 0)
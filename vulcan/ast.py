@@ -1,6 +1,20 @@
 
 
+from .prim import PRIMITIVES
+
+
 class Expr:
+    is_atomic = False
+    fields = ()
+    # set by trace.number_nodes
+    trace_id = -1
+
+    def __reduce__(self):
+        # Rebuild from the constructor arguments, which keeps pickles small
+        # and drops anything cached on the node.  PrimAppExpr looks its
+        # primitive up again by name.
+        return self.__class__, tuple(getattr(self, f) for f in self.fields)
+
     def visit(self, visitor, *args, **kwargs):
         base_name = self.__class__.__name__[:-4].lower()
         name = f'visit_{base_name}'
@@ -9,18 +23,79 @@ class Expr:
 
 
 class LetExpr(Expr):
-    def __init__(self, b_vars, b_exprs, body):
+    # slot is where b_vars start in the frame of a resolved program, see
+    # vulcan.resolve, and None in an unresolved one.  The same goes for
+    # the other binding forms below.
+    fields = ('b_vars', 'b_exprs', 'body', 'slot')
+
+    def __init__(self, b_vars, b_exprs, body, slot=None):
+        self.b_vars = b_vars
+        self.b_exprs = b_exprs
+        self.body = body
+        self.slot = slot
+
+
+class LetRecExpr(Expr):
+    # b_exprs are all LambdaExprs, closed over the env that binds b_vars.
+    fields = ('b_vars', 'b_exprs', 'body', 'slot')
+
+    def __init__(self, b_vars, b_exprs, body, slot=None):
         self.b_vars = b_vars
         self.b_exprs = b_exprs
         self.body = body
+        self.slot = slot
+
+
+class LetPrimExpr(Expr):
+    # A let whose bindings are all atomic or prim apps, evaluated inline
+    # without a continuation frame.  Made by vulcan.lower.
+    fields = ('b_vars', 'b_exprs', 'body', 'slot')
+
+    def __init__(self, b_vars, b_exprs, body, slot=None):
+        self.b_vars = b_vars
+        self.b_exprs = b_exprs
+        self.body = body
+        self.slot = slot
+
+
+class PrimIfExpr(Expr):
+    # A LetPrimExpr whose body is an if, run as one step.
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    fields = ('b_vars', 'b_exprs', 'test', 'conseq', 'alter', 'slot')
+
+    def __init__(self, b_vars, b_exprs, test, conseq, alter, slot=None):
+        self.b_vars = b_vars
+        self.b_exprs = b_exprs
+        self.test = test
+        self.conseq = conseq
+        self.alter = alter
+        self.slot = slot
+
+
+class LetAppExpr(Expr):
+    # A let with a single application binding, which returns straight to
+    # a KLetApp frame.  Made by vulcan.lower.
+    fields = ('b_vars', 'app', 'body', 'slot')
+
+    def __init__(self, b_vars, app, body, slot=None):
+        self.b_vars = b_vars
+        self.app = app
+        self.body = body
+        self.slot = slot
 
 
 class SeqExpr(Expr):
+    fields = ('exprs',)
+
     def __init__(self, exprs):
         self.exprs = exprs
 
 
 class RefExpr(Expr):
+    is_atomic = True
+
+    fields = ('name',)
+
     def __init__(self, name):
         self.name = name
 
@@ -28,7 +103,39 @@ class RefExpr(Expr):
         return intp.env.get(self.name)
 
 
+class LexRefExpr(Expr):
+    is_atomic = True
+
+    # A reference resolved to a (depth, slot) lexical address.
+    fields = ('name', 'depth', 'slot')
+
+    def __init__(self, name, depth, slot):
+        self.name = name
+        self.depth = depth
+        self.slot = slot
+
+    def atomic_eval(self, intp):
+        return intp.env.lookup(self.depth, self.slot)
+
+
+class GlobalRefExpr(Expr):
+    is_atomic = True
+
+    # A reference with no lexical binding, looked up in the global env.
+    fields = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def atomic_eval(self, intp):
+        return intp.global_env.get(self.name)
+
+
 class DatumExpr(Expr):
+    is_atomic = True
+
+    fields = ('value',)
+
     def __init__(self, a_value):
         self.value = a_value
 
@@ -37,30 +144,104 @@ class DatumExpr(Expr):
 
 
 class IfExpr(Expr):
+    fields = ('test', 'conseq', 'alter')
+
     def __init__(self, test, conseq, alter):
         self.test = test
         self.conseq = conseq
         self.alter = alter
 
 
+def make_binder(args):
+    # builds the binds dict of a closure entry without zip for small arities
+    if len(args) == 0:
+        return lambda vals: {}
+    if len(args) == 1:
+        arg0, = args
+        return lambda vals: {arg0: vals[0]}
+    if len(args) == 2:
+        arg0, arg1 = args
+        return lambda vals: {arg0: vals[0], arg1: vals[1]}
+    if len(args) == 3:
+        arg0, arg1, arg2 = args
+        return lambda vals: {arg0: vals[0], arg1: vals[1], arg2: vals[2]}
+    return lambda vals: dict(zip(args, vals))
+
+
 class LambdaExpr(Expr):
-    def __init__(self, args, body):
+    is_atomic = True
+    # set by memo.mark_pure
+    pure = False
+
+    # let_vars are the names the lets in a resolved body bind in the
+    # lambda's frame, after args
+    fields = ('args', 'body', 'let_vars')
+
+    def __init__(self, args, body, let_vars=()):
         self.args = args
         self.body = body
+        self.let_vars = let_vars
+        self.frame_vars = list(args) + list(let_vars)
+        self.arity = len(args)
+        self.bind = make_binder(args)
+
+    def __reduce__(self):
+        # the pure mark is analysis, not a constructor argument
+        cls, args = super().__reduce__()
+        if self.pure:
+            return cls, args, {'pure': True}
+        return cls, args
 
     def atomic_eval(self, intp):
         return intp.make_closure(self)
 
+
+class FlatLambdaExpr(LambdaExpr):
+    # A resolved lambda whose closure copies only its free variables into
+    # a record frame.  free_refs address them in the defining scope.
+    # pylint: disable=too-many-arguments
+    fields = ('args', 'body', 'free_vars', 'free_refs', 'let_vars')
+
+    def __init__(self, args, body, free_vars, free_refs, let_vars=()):
+        super().__init__(args, body, let_vars)
+        self.free_vars = free_vars
+        self.free_refs = free_refs
+
+    def atomic_eval(self, intp):
+        return intp.make_flat_closure(self)
+
+
 class AppExpr(Expr):
+    # inline cache: the LambdaExpr last called here with a checked arity
+    callee = None
+
+    fields = ('rator', 'rands')
+
     def __init__(self, rator, rands):
         self.rator = rator
         self.rands = rands
 
 
 class PrimAppExpr(Expr):
-    def __init__(self, name, rands):
+    fields = ('name', 'rands')
+
+    def __init__(self, name, rands, prim=None):
+        if prim is None:
+            prim = PRIMITIVES.lookup(name)
         self.name = name
         self.rands = rands
+        self.prim = prim
+
+
+class ResolvedExpr(Expr):
+    # A program whose references have been lexically addressed, see
+    # vulcan.resolve.  It runs its body with frame environments, starting
+    # in a frame holding let_vars, the names its top level lets bind.
+    fields = ('body', 'let_vars')
+
+    def __init__(self, body, let_vars=()):
+        self.body = body
+        self.let_vars = let_vars
 
 
 def classify_sexp(a_sexp):
@@ -70,7 +251,7 @@ def classify_sexp(a_sexp):
             return 'aexp'
         elif tag in ('#%prim', '#%app', '#%if'):
             return 'cexp'
-        elif tag in ('#%let', '#%begin'):
+        elif tag in ('#%let', '#%letrec', '#%begin'):
             return 'exp'
     elif isinstance(a_sexp, str):
         return "aexp"
@@ -87,6 +268,8 @@ def parse_sexp_exp(a_sexp):
         tag = a_sexp[0]
         if tag == '#%let':
             return parse_let_sexp(a_sexp)
+        elif tag == '#%letrec':
+            return parse_letrec_sexp(a_sexp)
         elif tag == '#%begin':
             return parse_sexp_seq(a_sexp[1:])
     raise Exception(f'cannot handle exp {a_sexp!r}')
@@ -108,6 +291,14 @@ def parse_let_sexp(a_sexp):
     return LetExpr(bind_vars, bind_exprs, body_ast)
 
 
+def parse_letrec_sexp(a_sexp):
+    a_let = parse_let_sexp(a_sexp)
+    for bind_expr in a_let.b_exprs:
+        if not isinstance(bind_expr, LambdaExpr):
+            raise Exception(f'#%letrec binding should be a #%lambda got: {a_sexp!r}')
+    return LetRecExpr(a_let.b_vars, a_let.b_exprs, a_let.body)
+
+
 def parse_sexp_aexp(a_sexp):
     a_sexp_t = classify_sexp(a_sexp)
     if a_sexp_t != 'aexp':
@@ -140,7 +331,11 @@ def parse_sexp_cexp(a_sexp):
             rands = parse_sexps(parse_sexp_aexp, a_sexp[2:])
             if not isinstance(rator, str):
                 raise Exception(f'operator should be an identifier for primapp got: {rator!r}')
-            return PrimAppExpr(rator, rands)
+            prim = PRIMITIVES.lookup(rator)
+            if len(rands) != prim.arity:
+                raise Exception(f'{rator} expects {prim.arity} arguments '
+                                f'got {len(rands)}: {a_sexp!r}')
+            return PrimAppExpr(rator, rands, prim)
         elif tag == '#%app':
             rator = parse_sexp_aexp(a_sexp[1])
             rands = parse_sexps(parse_sexp_aexp, a_sexp[2:])
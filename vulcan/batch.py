@@ -0,0 +1,75 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .eval import EmptyEnv, RegisterInterpreter
+
+
+class BatchResult:
+    def __init__(self, index, value=None, error=None):
+        self.index = index
+        self.value = value
+        self.error = error
+
+
+class BatchStats:
+    def __init__(self, workers, jobs, elapsed):
+        self.workers = workers
+        self.jobs = jobs
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        return self.jobs / self.elapsed if self.elapsed else float('inf')
+
+
+def run_job(engine, ast, inputs):
+    # inputs maps free variables of the program to their values
+    global_env = EmptyEnv().extend(list(inputs), list(inputs.values()))
+    return engine(global_env).eval(ast)
+
+
+def eval_batch(jobs, workers=None, engine=RegisterInterpreter):
+    # jobs is an iterable of (ast, inputs) pairs.  Yields a BatchResult
+    # per job, indexed in submission order, as each one completes.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, engine, ast, inputs): i
+                   for i, (ast, inputs) in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            error = future.exception()
+            if error is None:
+                yield BatchResult(index, future.result())
+            else:
+                yield BatchResult(index, error=error)
+
+
+def measure_batch(jobs, workers=None, engine=RegisterInterpreter):
+    jobs = list(jobs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    results = sorted(eval_batch(jobs, workers, engine), key=lambda r: r.index)
+    return results, BatchStats(workers, len(jobs), time.perf_counter() - start)
+
+
+def measure_scaling(jobs, worker_counts=None, engine=RegisterInterpreter):
+    # Returns a BatchStats per worker count, to compare throughput across
+    # cores.
+    jobs = list(jobs)
+    if worker_counts is None:
+        cpus = os.cpu_count() or 1
+        worker_counts = sorted({1, max(1, cpus // 2), cpus})
+    return [measure_batch(jobs, n, engine)[1] for n in worker_counts]
+
+
+def scaling_report(all_stats):
+    base = all_stats[0].throughput
+    return '\n'.join(f'{s.workers:3d} workers  {s.throughput:10.1f} jobs/s  '
+                     f'{s.throughput / base:5.2f}x'
+                     for s in all_stats)
+
+
+if __name__ == '__main__':
+    from .bench import FIB_PGM, to_ast
+    print(scaling_report(measure_scaling([(to_ast(FIB_PGM), {})] * 64)))
@@ -0,0 +1,179 @@
+import time
+
+from .ast import parse_sexp_seq
+from .codegen import PythonCompiler
+from .compiler import Compiler
+from .eval import HamtEnv, Interpreter, RegisterInterpreter
+from .lower import lower
+from .memo import MemoCache, mark_pure
+from .optimize import optimize
+from .read import read_all
+from .resolve import resolve
+
+
+SUM_PGM = '''
+  (#%let ([sum-loc (#%prim box (#%datum #undefined))])
+    (#%prim set_box
+               sum-loc
+               (#%lambda (x)
+                 (#%let ([is_zero-result (#%prim is_zero x)])
+                   (#%if is_zero-result
+                         (#%datum 0)
+                         (#%let ([rec (#%prim unbox sum-loc)]
+                                 [x0  (#%prim sub1 x)])
+                           (#%let ([x1 (#%app rec x0)])
+                             (#%prim plus x x1)))))))
+    (#%let ([sum (#%prim unbox sum-loc)])
+      (#%app sum (#%datum 2000))))
+'''
+
+LOOP_PGM = '''
+  (#%let ([loop-loc (#%prim box (#%datum #undefined))])
+    (#%prim set_box
+               loop-loc
+               (#%lambda (n acc)
+                 (#%let ([done (#%prim is_zero n)])
+                   (#%if done
+                         acc
+                         (#%let ([rec (#%prim unbox loop-loc)]
+                                 [n0  (#%prim sub1 n)]
+                                 [acc0 (#%prim plus acc n)])
+                           (#%app rec n0 acc0))))))
+    (#%let ([loop (#%prim unbox loop-loc)])
+      (#%app loop (#%datum 5000) (#%datum 0))))
+'''
+
+FIB_PGM = '''
+  (#%let ([fib-loc (#%prim box (#%datum #undefined))])
+    (#%prim set_box
+               fib-loc
+               (#%lambda (n)
+                 (#%let ([n0 (#%prim is_zero n)])
+                   (#%if n0
+                         (#%datum 0)
+                         (#%let ([n1 (#%prim is_equal n (#%datum 1))])
+                           (#%if n1
+                                 (#%datum 1)
+                                 (#%let ([rec (#%prim unbox fib-loc)]
+                                         [a (#%prim sub1 n)])
+                                   (#%let ([b (#%prim sub1 a)])
+                                     (#%let ([fa (#%app rec a)]
+                                             [fb (#%app rec b)])
+                                       (#%prim plus fa fb))))))))))
+    (#%let ([fib (#%prim unbox fib-loc)])
+      (#%app fib (#%datum 16))))
+'''
+
+
+def nested_pgm(depth=40, n=200):
+    # A loop whose body nests depth lets, so the innermost references to
+    # n, acc and loop sit under depth scopes.  Sums n + depth for 1..n.
+    lines = ['(#%let ([v0 (#%prim add1 n)])']
+    for i in range(1, depth):
+        lines.append(f'(#%let ([v{i} (#%prim add1 v{i - 1})])')
+    lines.append('(#%let ([m (#%prim sub1 n)]'
+                 f' [a (#%prim plus acc v{depth - 1})])'
+                 ' (#%app loop m a))')
+    body = '\n'.join(lines) + ')' * depth
+    return f'''
+  (#%letrec ([loop (#%lambda (n acc)
+                     (#%let ([z (#%prim is_zero n)])
+                       (#%if z
+                             acc
+                             {body})))])
+    (#%app loop (#%datum {n}) (#%datum 0)))
+'''
+
+
+PROGRAMS = {
+    'sum': SUM_PGM,
+    'loop': LOOP_PGM,
+    'fib': FIB_PGM,
+    'nested': nested_pgm(),
+}
+
+
+# name -> (engine factory, AST preparation run outside the timing)
+ENGINES = {
+    'cek': (Interpreter, None),
+    'register': (RegisterInterpreter, None),
+    'cek+hamt': (lambda: Interpreter(local_env=HamtEnv), None),
+    'register+hamt': (lambda: RegisterInterpreter(local_env=HamtEnv), None),
+    'cek+lex': (Interpreter, resolve),
+    'register+lex': (RegisterInterpreter, resolve),
+    'register+opt': (RegisterInterpreter, optimize),
+    'register+low': (RegisterInterpreter,
+                     lambda ast: lower(resolve(optimize(ast)))),
+    'register+memo': (lambda: RegisterInterpreter(memo=MemoCache()),
+                      lambda ast: mark_pure(resolve(optimize(ast)))),
+    'closure': (Compiler, None),
+    'python': (PythonCompiler, None),
+}
+
+
+def to_ast(a_string):
+    return parse_sexp_seq(read_all(a_string))
+
+
+def time_engine(make_engine, ast, repeat=5):
+    best = None
+    for _ in range(repeat):
+        engine = make_engine()
+        if hasattr(engine, 'compile'):
+            engine.compile(ast)
+        start = time.perf_counter()
+        engine.eval(ast)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_benchmarks(programs=None, engines=None, repeat=5):
+    programs = PROGRAMS if programs is None else programs
+    engines = ENGINES if engines is None else engines
+    results = []
+    for pgm_name, pgm in programs.items():
+        ast = to_ast(pgm)
+        for engine_name, (make_engine, prepare) in engines.items():
+            prepared = ast if prepare is None else prepare(ast)
+            results.append((pgm_name, engine_name,
+                            time_engine(make_engine, prepared, repeat)))
+    return results
+
+
+def count_steps(ast):
+    intp = Interpreter()
+    intp.load(ast)
+    steps = 0
+    while not intp.halt:
+        intp.step()
+        steps += 1
+    return steps
+
+
+def step_report(programs=None):
+    programs = PROGRAMS if programs is None else programs
+    lines = []
+    for pgm_name, pgm in programs.items():
+        ast = to_ast(pgm)
+        plain = count_steps(ast)
+        lowered = count_steps(lower(resolve(optimize(ast))))
+        lines.append(f'{pgm_name:<10} steps {plain:9d} -> {lowered:9d}  '
+                     f'{plain / lowered:6.2f}x')
+    return '\n'.join(lines)
+
+
+def report(results):
+    baselines = {}
+    lines = []
+    for pgm_name, engine_name, elapsed in results:
+        base = baselines.setdefault(pgm_name, elapsed)
+        lines.append(f'{pgm_name:<10} {engine_name:<12} '
+                     f'{elapsed * 1000:9.2f} ms  {base / elapsed:6.2f}x')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(report(run_benchmarks()))
+    print(step_report())
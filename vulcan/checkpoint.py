@@ -0,0 +1,26 @@
+import pickle
+import zlib
+
+
+def checkpoint(intp, compress=True):
+    # Snapshot an interpreter between steps, e.g. after run(max_steps)
+    # returned Suspended.  The interpreter is pickled whole, so its
+    # configuration (memo, local_env, limits, ...) comes back with it and
+    # envs, boxes and closures shared between frames are stored once.
+    if intp.pending is not None:
+        raise Exception('cannot checkpoint while awaiting an async primitive')
+    data = pickle.dumps(intp, pickle.HIGHEST_PROTOCOL)
+    if compress:
+        return b'z' + zlib.compress(data)
+    return b'p' + data
+
+
+def restore(data):
+    if data[:1] == b'z':
+        data = zlib.decompress(data[1:])
+    else:
+        data = data[1:]
+    intp = pickle.loads(data)
+    # resumed with run, not inside the eval_async that was running
+    intp.in_async = False
+    return intp
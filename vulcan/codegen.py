@@ -0,0 +1,260 @@
+from collections import OrderedDict
+import re
+
+from .ast import IfExpr, LetExpr, ResolvedExpr
+from .compiler import CallDepth, Compiler, TailCall, deepen
+from .type import check_arity, undefined
+
+
+# Generated functions call each other through C, so each Python frame
+# costs C stack as well.  Non-tail calls stop at MAX_CALL_DEPTH, well
+# before they could overflow the C stack.
+_calls = CallDepth()
+MAX_CALL_DEPTH = 6000
+
+
+def call(proc, args):
+    calls = _calls
+    if calls.depth >= calls.check_at:
+        deepen(calls, MAX_CALL_DEPTH)
+    calls.depth += 1
+    try:
+        while True:
+            # generated functions carry their arity, see visit_lambda
+            if getattr(proc, 'arity', None) is None:
+                raise Exception(f'cannot apply {proc!r}')
+            check_arity(proc, args)
+            result = proc(*args)
+            if result.__class__ is TailCall:
+                proc = result.proc
+                args = result.args
+            else:
+                return result
+    finally:
+        calls.depth -= 1
+
+
+def finish(result):
+    if result.__class__ is TailCall:
+        return call(result.proc, result.args)
+    return result
+
+
+_RETURN = object()
+_DISCARD = object()
+
+# code objects are shared by every engine, keyed by generated source,
+# keeping the code_cache_size most recently used
+_code_cache = OrderedDict()
+code_cache_size = 256
+
+
+def compile_source(source):
+    code = _code_cache.pop(source, None)
+    if code is None:
+        code = compile(source, '<vulcan>', 'exec')
+    _code_cache[source] = code
+    while len(_code_cache) > code_cache_size:
+        _code_cache.popitem(last=False)
+    return code
+
+
+class CodeGenerator:
+    # Emits the Python source of a single function, _program(_env), for an
+    # ANF program.  Every binding gets its own Python name so closures see
+    # the binding they were created under.  Statements that produce a
+    # value go either to a target name, a return, or are discarded.
+    def __init__(self):
+        self.lines = []
+        self.indent = 1
+        self.counter = 0
+        self.prims = {}
+        self.constants = []
+
+    def generate(self, ast):
+        if isinstance(ast, ResolvedExpr):
+            ast = ast.body
+        self.lines.append('def _program(_env):')
+        self.emit(ast, {}, _RETURN)
+        return '\n'.join(self.lines) + '\n'
+
+    def fresh(self, name):
+        self.counter += 1
+        return f'_v{self.counter}_{re.sub(r"[^0-9a-zA-Z_]", "_", name)}'
+
+    def line(self, text):
+        self.lines.append('    ' * self.indent + text)
+
+    def emit(self, ast, scope, target):
+        ast.visit(self, scope, target)
+
+    def store(self, text, target):
+        if target is _RETURN:
+            self.line(f'return {text}')
+        elif target is _DISCARD:
+            self.line(text)
+        else:
+            self.line(f'{target} = {text}')
+
+    def atomic(self, ast, scope):
+        return ast.visit(self, scope, None)
+
+    def atomics(self, asts, scope):
+        return ', '.join(self.atomic(a, scope) for a in asts)
+
+    def visit_let(self, a_let, scope, target):
+        names = [self.fresh(v) for v in a_let.b_vars]
+        for name, b_expr in zip(names, a_let.b_exprs):
+            self.emit(b_expr, scope, name)
+        body_scope = dict(scope)
+        body_scope.update(zip(a_let.b_vars, names))
+        self.emit(a_let.body, body_scope, target)
+
+    # lowered nodes compile as the let and if they were made from
+    visit_letprim = visit_let
+
+    def visit_primif(self, a_primif, scope, target):
+        an_if = IfExpr(a_primif.test, a_primif.conseq, a_primif.alter)
+        a_let = LetExpr(a_primif.b_vars, a_primif.b_exprs, an_if)
+        return self.visit_let(a_let, scope, target)
+
+    def visit_letapp(self, a_let, scope, target):
+        a_let = LetExpr(a_let.b_vars, [a_let.app], a_let.body)
+        return self.visit_let(a_let, scope, target)
+
+    def visit_letrec(self, a_letrec, scope, target):
+        # nested defs see each other through their closure cells
+        body_scope = dict(scope)
+        names = [self.fresh(v) for v in a_letrec.b_vars]
+        body_scope.update(zip(a_letrec.b_vars, names))
+        for name, b_expr in zip(names, a_letrec.b_exprs):
+            self.emit(b_expr, body_scope, name)
+        self.emit(a_letrec.body, body_scope, target)
+
+    def visit_seq(self, a_seq, scope, target):
+        for expr in a_seq.exprs[:-1]:
+            self.emit(expr, scope, _DISCARD)
+        self.emit(a_seq.exprs[-1], scope, target)
+
+    def visit_ref(self, a_ref, scope, target):
+        name = scope.get(a_ref.name)
+        if name is None:
+            name = f'_env.get({a_ref.name!r})'
+            if target is _DISCARD:
+                # still raises for an unbound name
+                self.line(name)
+                return None
+        return self.value(name, target)
+
+    visit_lexref = visit_ref
+    visit_globalref = visit_ref
+
+    # pylint: disable=unused-argument
+    def visit_datum(self, a_datum, scope, target):
+        value = a_datum.value
+        if value is undefined:
+            text = '_undefined'
+        elif value is None or isinstance(value, (bool, int)):
+            text = repr(value)
+        else:
+            self.constants.append(value)
+            text = f'_c{len(self.constants) - 1}'
+        return self.value(text, target)
+
+    def value(self, text, target):
+        if target is None:
+            return text
+        if target is not _DISCARD:
+            self.store(text, target)
+        return None
+
+    def visit_if(self, an_if, scope, target, keyword='if'):
+        # A returning conseq needs no else and an if in the alter becomes
+        # an elif, so chains of ifs do not nest Python blocks.
+        test = self.atomic(an_if.test, scope)
+        self.line(f'{keyword} {test} is not False:')
+        self.block(an_if.conseq, scope, target)
+        alter = an_if.alter
+        if target is _RETURN:
+            self.emit(alter, scope, target)
+        elif isinstance(alter, IfExpr):
+            self.visit_if(alter, scope, target, 'elif')
+        else:
+            self.line('else:')
+            self.block(alter, scope, target)
+
+    def block(self, ast, scope, target):
+        # a discarded atomic branch emits nothing
+        start = len(self.lines)
+        self.indent += 1
+        self.emit(ast, scope, target)
+        if len(self.lines) == start:
+            self.line('pass')
+        self.indent -= 1
+
+    def visit_lambda(self, a_lambda, scope, target):
+        self.counter += 1
+        fname = f'_f{self.counter}'
+        names = [self.fresh(v) for v in a_lambda.args]
+        self.line(f'def {fname}({", ".join(names)}):')
+        body_scope = dict(scope)
+        body_scope.update(zip(a_lambda.args, names))
+        self.indent += 1
+        self.emit(a_lambda.body, body_scope, _RETURN)
+        self.indent -= 1
+        self.line(f'{fname}.arity = {len(a_lambda.args)}')
+        return self.value(fname, target)
+
+    visit_flatlambda = visit_lambda
+
+    def visit_primapp(self, a_primapp, scope, target):
+        if a_primapp.prim.control:
+            raise Exception(f'{a_primapp.name} is not supported by the code generator')
+        self.prims[a_primapp.name] = a_primapp.prim
+        rands = self.atomics(a_primapp.rands, scope)
+        self.store(f'_prim_{a_primapp.name}({rands})', target)
+
+    def visit_app(self, an_app, scope, target):
+        rator = self.atomic(an_app.rator, scope)
+        rands = self.atomics(an_app.rands, scope)
+        if target is _RETURN:
+            self.line(f'return _TailCall({rator}, [{rands}])')
+        else:
+            self.store(f'_call({rator}, [{rands}])', target)
+
+
+class PythonCompiler(Compiler):
+    # Generates Python source for a program and runs it as real Python
+    # functions.  Lambdas are Python functions, prims are direct calls
+    # and tail calls return a TailCall for the trampoline.
+    calls = _calls
+
+    def generate(self, ast):
+        generator = CodeGenerator()
+        source = generator.generate(ast)
+        return source, generator
+
+    def compile(self, ast):
+        program = self.cache.get(ast)
+        if program is None:
+            source, generator = self.generate(ast)
+            namespace = {
+                '_call': call,
+                '_TailCall': TailCall,
+                '_undefined': undefined,
+            }
+            for name, prim in generator.prims.items():
+                namespace[f'_prim_{name}'] = prim.fn.__get__(self)
+            for i, value in enumerate(generator.constants):
+                namespace[f'_c{i}'] = value
+            exec(compile_source(source), namespace) # pylint: disable=exec-used
+            program = namespace['_program']
+            # call's frame and the generated function's
+            program.call_frames = 2
+            # bindings are Python names, so the program frame stays empty
+            program.let_vars = ()
+            self.cache[ast] = program
+        return program
+
+    def finish(self, result):
+        return finish(result)
@@ -0,0 +1,311 @@
+from contextlib import contextmanager
+import sys
+import threading
+import weakref
+
+from .ast import IfExpr, LetExpr
+from .eval import EmptyEnv, FrameEnv
+from .prim import Primitives
+from .resolve import resolve
+from .type import check_arity, undefined
+
+
+class TailCall:
+    def __init__(self, proc, args):
+        self.proc = proc
+        self.args = args
+
+
+class CompiledClosure:
+    def __init__(self, env, ast, body):
+        self.env = env
+        self.ast = ast
+        self.body = body
+
+
+class CallDepth(threading.local):
+    # Non-tail calls nested in this thread.  call only looks further when
+    # depth reaches check_at, see deepen.  eval sets base, the stack depth
+    # it started at, and frames, the Python frames each nested call takes.
+    depth = 0
+    check_at = 0
+    base = 0
+    frames = 1
+
+
+_calls = CallDepth()
+MAX_CALL_DEPTH = 10000
+# calls between checks of the recursion limit
+_CHUNK = 64
+_SLACK = 50
+
+
+def deepen(calls, max_depth):
+    # Called every _CHUNK nested calls: stop at max_depth, else make sure
+    # the recursion limit has room for the next _CHUNK calls.  Shallow
+    # programs never change the limit.
+    if calls.depth >= max_depth:
+        raise Exception(f'call depth limit of {max_depth} exceeded')
+    calls.check_at = min(calls.depth + _CHUNK, max_depth)
+    grow_recursion_limit(calls.base + (calls.check_at + 1) * calls.frames + _SLACK)
+
+
+def call(proc, args):
+    # Trampoline: bodies return a TailCall instead of calling in tail
+    # position, so tail recursion runs in constant Python stack.
+    calls = _calls
+    if calls.depth >= calls.check_at:
+        deepen(calls, MAX_CALL_DEPTH)
+    calls.depth += 1
+    try:
+        while True:
+            if proc.__class__ is not CompiledClosure:
+                raise Exception(f'cannot apply {proc!r}')
+            a_lambda = proc.ast
+            check_arity(a_lambda, args)
+            result = proc.body(proc.env.enter(a_lambda, args))
+            if result.__class__ is TailCall:
+                proc = result.proc
+                args = result.args
+            else:
+                return result
+    finally:
+        calls.depth -= 1
+
+
+def finish(result):
+    if result.__class__ is TailCall:
+        return call(result.proc, result.args)
+    return result
+
+
+def make_lookup(depth, slot):
+    if depth == 0:
+        return lambda env: env.vals[slot]
+    if depth == 1:
+        return lambda env: env.parent.vals[slot]
+    if depth == 2:
+        return lambda env: env.parent.parent.vals[slot]
+    return lambda env: env.lookup(depth, slot)
+
+
+def stack_depth():
+    depth = 0
+    frame = sys._getframe(1)  # pylint: disable=protected-access
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+MAX_RECURSION_LIMIT = 200000
+_limit_lock = threading.Lock()
+_limit_users = 0
+_saved_limit = None
+
+
+@contextmanager
+def recursion_guard():
+    # The recursion limit is process wide.  Evals hold this while they
+    # run, grow_recursion_limit only raises it while one does and the
+    # last one to finish puts it back.
+    global _limit_users, _saved_limit  # pylint: disable=global-statement
+    with _limit_lock:
+        if _limit_users == 0:
+            _saved_limit = sys.getrecursionlimit()
+        _limit_users += 1
+    try:
+        yield
+    finally:
+        with _limit_lock:
+            _limit_users -= 1
+            if _limit_users == 0 and sys.getrecursionlimit() != _saved_limit:
+                sys.setrecursionlimit(_saved_limit)
+
+
+def grow_recursion_limit(limit):
+    # past MAX_RECURSION_LIMIT programs get a RecursionError instead
+    limit = min(limit, MAX_RECURSION_LIMIT)
+    with _limit_lock:
+        if _limit_users > 0 and limit > sys.getrecursionlimit():
+            sys.setrecursionlimit(limit)
+
+
+class Compiler(Primitives):
+    # Compiles an AST once, resolving it first, into nested Python
+    # closures taking a FrameEnv.
+    # Non-tail calls use the Python stack, so the recursion limit is
+    # raised as far as the calls actually nest need, and call stops at
+    # MAX_CALL_DEPTH nested calls.  Unlike Interpreter.eval, which keeps
+    # its continuation on the heap, deeper non-tail recursion fails here.
+    calls = _calls
+
+    def __init__(self, global_env=None):
+        if global_env is None:
+            global_env = EmptyEnv()
+        self.global_env = global_env
+        self.cache = weakref.WeakKeyDictionary()
+        self.nesting = 0
+        self.call_frames = 1
+
+    def compile(self, ast):
+        code = self.cache.get(ast)
+        if code is None:
+            # nesting counts the closures a node runs under within its
+            # lambda body, call_frames is the most a non-tail call needs
+            self.nesting = 0
+            self.call_frames = 1
+            resolved = resolve(ast)
+            code = self.compile_exp(resolved.body, True)
+            code.call_frames = self.call_frames
+            code.let_vars = resolved.let_vars
+            self.cache[ast] = code
+        return code
+
+    def eval(self, ast):
+        code = self.compile(ast)
+        calls = self.calls
+        calls.base = stack_depth()
+        calls.frames = code.call_frames
+        calls.check_at = calls.depth
+        let_vars = code.let_vars
+        env = FrameEnv(self.global_env, let_vars, [undefined] * len(let_vars))
+        with recursion_guard():
+            return self.finish(code(env))
+
+    def finish(self, result):
+        return finish(result)
+
+    def compile_exp(self, ast, tail):
+        self.nesting += 1
+        try:
+            return ast.visit(self, tail)
+        finally:
+            self.nesting -= 1
+
+    def compile_all(self, asts):
+        return [self.compile_exp(a, False) for a in asts]
+
+    def visit_let(self, a_let, tail):
+        # the values go into their slots in the frame the let runs in
+        slot = a_let.slot
+        end = slot + len(a_let.b_vars)
+        codes = self.compile_all(a_let.b_exprs)
+        body = self.compile_exp(a_let.body, tail)
+        if len(codes) == 1:
+            code0 = codes[0]
+
+            def run_let1(env):
+                env.vals[slot] = code0(env)
+                return body(env)
+            return run_let1
+
+        def run_let(env):
+            env.vals[slot:end] = [c(env) for c in codes]
+            return body(env)
+        return run_let
+
+    # lowered nodes compile as the let and if they were made from
+    visit_letprim = visit_let
+
+    def visit_primif(self, a_primif, tail):
+        an_if = IfExpr(a_primif.test, a_primif.conseq, a_primif.alter)
+        a_let = LetExpr(a_primif.b_vars, a_primif.b_exprs, an_if, a_primif.slot)
+        return self.visit_let(a_let, tail)
+
+    def visit_letapp(self, a_let, tail):
+        a_let = LetExpr(a_let.b_vars, [a_let.app], a_let.body, a_let.slot)
+        return self.visit_let(a_let, tail)
+
+    def visit_letrec(self, a_letrec, tail):
+        slot = a_letrec.slot
+        end = slot + len(a_letrec.b_vars)
+        codes = self.compile_all(a_letrec.b_exprs)
+        body = self.compile_exp(a_letrec.body, tail)
+
+        def run_letrec(env):
+            vals = env.vals
+            vals[slot:end] = [undefined] * (end - slot)
+            vals[slot:end] = [c(env) for c in codes]
+            return body(env)
+        return run_letrec
+
+    def visit_seq(self, a_seq, tail):
+        codes = self.compile_all(a_seq.exprs[:-1])
+        last = self.compile_exp(a_seq.exprs[-1], tail)
+
+        def run_seq(env):
+            for code in codes:
+                code(env)
+            return last(env)
+        return run_seq
+
+    # pylint: disable=unused-argument
+    def visit_lexref(self, a_ref, tail):
+        return make_lookup(a_ref.depth, a_ref.slot)
+
+    # pylint: disable=unused-argument
+    def visit_globalref(self, a_ref, tail):
+        global_env = self.global_env
+        name = a_ref.name
+        return lambda env: global_env.get(name)
+
+    # pylint: disable=unused-argument
+    def visit_datum(self, a_datum, tail):
+        value = a_datum.value
+        return lambda env: value
+
+    def visit_if(self, an_if, tail):
+        test = self.compile_exp(an_if.test, False)
+        conseq = self.compile_exp(an_if.conseq, tail)
+        alter = self.compile_exp(an_if.alter, tail)
+        return lambda env: conseq(env) if test(env) is not False else alter(env)
+
+    def compile_body(self, a_lambda):
+        # a body runs under call, not under the closures around the lambda
+        nesting = self.nesting
+        self.nesting = 0
+        try:
+            return self.compile_exp(a_lambda.body, True)
+        finally:
+            self.nesting = nesting
+
+    # pylint: disable=unused-argument
+    def visit_lambda(self, a_lambda, tail):
+        body = self.compile_body(a_lambda)
+        return lambda env: CompiledClosure(env, a_lambda, body)
+
+    # pylint: disable=unused-argument
+    def visit_flatlambda(self, a_lambda, tail):
+        body = self.compile_body(a_lambda)
+        codes = self.compile_all(a_lambda.free_refs)
+        free_vars = a_lambda.free_vars
+        global_env = self.global_env
+
+        def make_closure(env):
+            record = FrameEnv(global_env, free_vars, [c(env) for c in codes])
+            return CompiledClosure(record, a_lambda, body)
+        return make_closure
+
+    # pylint: disable=unused-argument
+    def visit_primapp(self, a_primapp, tail):
+        if a_primapp.prim.control:
+            raise Exception(f'{a_primapp.name} is not supported by the compiler')
+        prim = a_primapp.prim.fn.__get__(self)
+        codes = self.compile_all(a_primapp.rands)
+        if len(codes) == 1:
+            code0 = codes[0]
+            return lambda env: prim(code0(env))
+        if len(codes) == 2:
+            code0, code1 = codes
+            return lambda env: prim(code0(env), code1(env))
+        return lambda env: prim(*[c(env) for c in codes])
+
+    def visit_app(self, an_app, tail):
+        rator = self.compile_exp(an_app.rator, False)
+        codes = self.compile_all(an_app.rands)
+        if tail:
+            return lambda env: TailCall(rator(env), [c(env) for c in codes])
+        # this closure's frame and call's
+        self.call_frames = max(self.call_frames, self.nesting + 1)
+        return lambda env: call(rator(env), [c(env) for c in codes])
@@ -1,6 +1,13 @@
 
+import asyncio
+
+from .ast import (AppExpr, DatumExpr, FlatLambdaExpr, IfExpr, LambdaExpr,
+                  LetAppExpr, LetExpr, LetPrimExpr, LexRefExpr, PrimAppExpr,
+                  PrimIfExpr, RefExpr, SeqExpr)
+from .hamt import Hamt
 from .prim import Primitives
-from .type import Closure
+from .type import (Closure, Continuation, check_arity, link, undefined,
+                   unlink)
 
 
 class EmptyEnv:
@@ -8,6 +15,14 @@ class EmptyEnv:
     def extend(self, vars, vals):
         return Env(self, vars, vals)
 
+    def enter(self, a_lambda, vals):
+        # bind a closure's (arity checked) arguments on entry
+        return Env.from_binds(self, a_lambda.bind(vals))
+
+    def bind(self, a_let, vals):
+        # bind the values of a let or letrec
+        return self.extend(a_let.b_vars, vals)
+
     def get(self, name):
         raise Exception(f'{name} is not defined')
 
@@ -18,6 +33,16 @@ class Env(EmptyEnv):
         self.parent = parent
         self.binds = dict(zip(vars,vals))
 
+    @classmethod
+    def from_binds(cls, parent, binds):
+        env = cls.__new__(cls)
+        env.parent = parent
+        env.binds = binds
+        return env
+
+    def fill(self, a_letrec, vals):
+        self.binds.update(zip(a_letrec.b_vars, vals))
+
     def get(self, name):
         if name in self.binds:
             return self.binds[name]
@@ -25,18 +50,145 @@ class Env(EmptyEnv):
             return self.parent.get(name)
 
 
+def _missing():
+    return _missing
+
+
+def _found(_key, value):
+    return value
+
+
+class GlobalEnv(EmptyEnv):
+    # Persistent top level bindings.  define returns a new env and leaves
+    # this one as it was, so sharing or forking one is free.
+    def __init__(self, binds=None):
+        if binds is None:
+            binds = Hamt()
+        self.binds = binds
+
+    def define(self, name, value):
+        return GlobalEnv(self.binds.insert(name, value))
+
+    def get(self, name):
+        value = self.binds.lookup(name, _missing, _found)
+        if value is _missing:
+            return super().get(name)
+        return value
+
+
+class HamtEnv(EmptyEnv):
+    # pylint: disable=redefined-builtin
+    # Local bindings kept in one persistent map instead of a chain of
+    # dicts, extend inserts into a new version of it.  parent is the top
+    # level env and only sees names the map does not have, so lookups do
+    # not depend on how deeply scopes nest.  Lexically addressed code
+    # uses FrameEnv instead.
+    def __init__(self, parent, binds=None):
+        if binds is None:
+            binds = Hamt()
+        self.parent = parent
+        self.binds = binds
+
+    def extend(self, vars, vals):
+        if len(vars) == 1:
+            return HamtEnv(self.parent, self.binds.insert(vars[0], vals[0]))
+        return HamtEnv(self.parent, self.binds.update_many(zip(vars, vals)))
+
+    def enter(self, a_lambda, vals):
+        return self.extend(a_lambda.args, vals)
+
+    def fill(self, a_letrec, vals):
+        self.binds = self.binds.update_many(zip(a_letrec.b_vars, vals))
+
+    def get(self, name):
+        value = self.binds.lookup(name, _missing, _found)
+        if value is _missing:
+            return self.parent.get(name)
+        return value
+
+
+def last_index(a_list, item):
+    for i in range(len(a_list) - 1, -1, -1):
+        if a_list[i] == item:
+            return i
+    return -1
+
+
+class FrameEnv(EmptyEnv):
+    # pylint: disable=redefined-builtin
+    # An array backed frame used for lexically addressed programs.  The
+    # variable names are shared with the AST and only used by get.  Only
+    # a lambda call or a program makes a frame, lets write their values
+    # into the slots the resolver gave them in the frame they run in, so
+    # a LexRefExpr depth counts just the enclosing lambdas.
+    def __init__(self, parent, vars, vals):
+        self.parent = parent
+        self.vars = vars
+        self.vals = vals
+
+    def extend(self, vars, vals):
+        return FrameEnv(self, vars, vals)
+
+    def enter(self, a_lambda, vals):
+        let_vars = a_lambda.let_vars
+        if let_vars:
+            return FrameEnv(self, a_lambda.frame_vars,
+                            vals + [undefined] * len(let_vars))
+        return FrameEnv(self, a_lambda.args, vals)
+
+    def bind(self, a_let, vals):
+        slot = a_let.slot
+        if slot is None:
+            return FrameEnv(self, a_let.b_vars, vals)
+        self.vals[slot:slot + len(vals)] = vals
+        return self
+
+    def fill(self, a_letrec, vals):
+        slot = a_letrec.slot or 0
+        self.vals[slot:slot + len(vals)] = vals
+
+    def get(self, name):
+        i = last_index(self.vars, name)
+        if i >= 0:
+            return self.vals[i]
+        return self.parent.get(name)
+
+    def lookup(self, depth, slot):
+        env = self
+        while depth > 0:
+            env = env.parent
+            depth -= 1
+        return env.vals[slot]
+
+
 class Stack:
+    # frames is a persistent linked list of (frame, rest) pairs so push,
+    # pop and capture are all constant time.
     def __init__(self):
-        self.frames = []
+        self.frames = None
 
     def push(self, frame):
-        self.frames = [frame] + self.frames
+        self.frames = (frame, self.frames)
 
     def pop(self):
-        top = self.frames[0]
-        self.frames = self.frames[1:]
+        top, self.frames = self.frames
         return top
 
+    def capture(self):
+        return self.frames
+
+    def restore(self, frames):
+        self.frames = frames
+
+    def __reduce__(self):
+        return linked_stack, (unlink(self.frames),)
+
+
+def linked_stack(a_list):
+    stack = Stack()
+    stack.frames = link(a_list)
+    return stack
+
 
 class KHalt:
     env = EmptyEnv()
@@ -46,21 +198,56 @@ class KHalt:
         intp.halt = True
 
 
+def cons_to_list(vals, n):
+    # vals is a linked list of (value, rest) pairs holding n values, most
+    # recent first.
+    ret = [None] * n
+    while vals is not None:
+        n -= 1
+        ret[n], vals = vals
+    return ret
+
+
 class KLet:
-    def __init__(self, env, bind_vals, ast):
+    # bind_vals is a linked list of the values bound so far, so frames
+    # share it and a captured continuation can safely return here twice.
+    def __init__(self, env, bind_vals, i, ast):
         self.env = env
         self.bind_vals = bind_vals
+        self.i = i
         self.ast = ast
 
     def step(self, intp, a_value):
-        b_vals = self.bind_vals + [a_value]
-        if len(self.ast.b_vars) == len(b_vals):
-            intp.extend_env(self.ast.b_vars, b_vals)
-            intp.doing(self.ast.body)
-        else:
-            i = len(b_vals)
-            intp.push_k(KLet(self.env, b_vals, self.ast))
-            intp.doing(self.ast.b_exprs[i])
+        intp.bind_let(self.ast, self.i + 1, (a_value, self.bind_vals))
+
+
+class KApply:
+    def __init__(self, env, proc):
+        self.env = env
+        self.proc = proc
+
+    def step(self, intp, a_value):
+        intp.apply_procedure(self.proc, [a_value])
+
+
+class KLetApp:
+    def __init__(self, env, ast):
+        self.env = env
+        self.ast = ast
+
+    def step(self, intp, a_value):
+        intp.extend_env(self.ast, [a_value])
+        intp.doing(self.ast.body)
+
+
+class KMemo:
+    def __init__(self, env, key):
+        self.env = env
+        self.key = key
+
+    def step(self, intp, a_value):
+        intp.memo.store(self.key, a_value)
+        intp.done(a_value)
 
 
 class KSeq:
@@ -94,13 +281,34 @@ class Done:
         intp.ret(self.value)
 
 
+class Suspended:
+    # Returned by run when it runs out of steps, the machine state stays
+    # in the interpreter.
+    def __init__(self, intp):
+        self.intp = intp
+
+    def resume(self, max_steps=None):
+        return self.intp.run(max_steps)
+
+
 class Interpreter(Primitives):
-    def __init__(self):
+    def __init__(self, global_env=None, memo=None, local_env=None):
+        if global_env is None:
+            global_env = EmptyEnv()
         self.halt = True
         self.state = None
         self.stack = Stack()
         self.stack.push(KHalt())
-        self.env = EmptyEnv()
+        self.global_env = global_env
+        self.env = global_env
+        self.in_async = False
+        self.pending = None
+        self.last_steps = 0
+        # MemoCache for closures marked pure by mark_pure, off when None
+        self.memo = memo
+        # called with global_env to make the env a program starts in, e.g.
+        # HamtEnv; None starts in global_env and extends with dict Envs
+        self.local_env = local_env
 
     def doing(self, ast):
         assert ast is not None
@@ -112,37 +320,129 @@ class Interpreter(Primitives):
     def push_k(self, k):
         self.stack.push(k)
 
-    # pylint: disable=redefined-builtin
-    def extend_env(self, vars, vals):
-        self.env = self.env.extend(vars, vals)
+    def extend_env(self, a_let, vals):
+        self.env = self.env.bind(a_let, vals)
 
-    def eval(self, ast):
+    def load(self, ast):
         self.stack = Stack()
         self.push_k(KHalt())
+        self.env = self.global_env
+        if self.local_env is not None:
+            self.env = self.local_env(self.global_env)
         self.state = Doing(ast)
         self.halt = False
-        return self.run()
-
-    def run(self):
-        while not self.halt:
-            self.step()
+        self.pending = None
+
+    def eval(self, ast, max_steps=None):
+        self.load(ast)
+        return self.run(max_steps)
+
+    def run(self, max_steps=None):
+        # last_steps is set to the steps this run took, however it ends
+        steps = 0
+        try:
+            if max_steps is None:
+                while not self.halt:
+                    self.step()
+                    steps += 1
+            else:
+                while not self.halt:
+                    if steps >= max_steps:
+                        return Suspended(self)
+                    self.step()
+                    steps += 1
+        finally:
+            self.last_steps = steps
+        if self.pending is not None:
+            return Suspended(self)
         return self.state.value
 
+    def await_primitive(self, coro):
+        # Called by async primitives: stop the machine until eval_async
+        # has awaited coro and hands the result to resume_with.
+        if not self.in_async:
+            coro.close()
+            raise Exception('async primitive called outside of eval_async')
+        self.pending = coro
+        self.halt = True
+
+    def resume_with(self, a_value):
+        self.pending = None
+        self.halt = False
+        self.done(a_value)
+
+    async def eval_async(self, ast, quantum=None):
+        # quantum bounds the steps run between awaits, so busy scripts
+        # still let others on the event loop run.
+        self.load(ast)
+        self.in_async = True
+        try:
+            result = self.run(quantum)
+            while isinstance(result, Suspended):
+                coro = self.pending
+                if coro is None:
+                    await asyncio.sleep(0)
+                else:
+                    self.resume_with(await coro)
+                result = self.run(quantum)
+            return result
+        finally:
+            # a coroutine that raised must not leave the run suspended
+            self.in_async = False
+            self.pending = None
+
     def step(self):
         self.state.step(self)
 
     def atomic_eval(self, ast):
         return ast.atomic_eval(self)
 
+    def inline_eval(self, ast):
+        if isinstance(ast, PrimAppExpr):
+            rands = [a.atomic_eval(self) for a in ast.rands]
+            return ast.prim.fn(self, *rands)
+        return ast.atomic_eval(self)
+
     def make_closure(self, a_lambda):
         return Closure(self.env, a_lambda)
 
+    def make_flat_closure(self, a_lambda):
+        vals = [r.atomic_eval(self) for r in a_lambda.free_refs]
+        record = FrameEnv(self.global_env, a_lambda.free_vars, vals)
+        return Closure(record, a_lambda)
+
+    def enter_closure(self, a_closure, vals):
+        a_lambda = a_closure.ast
+        self.env = a_closure.env.enter(a_lambda, vals)
+        self.doing(a_lambda.body)
+
     def apply_procedure(self, proc, args):
+        if self.memo is not None and proc.__class__ is Closure and proc.ast.pure:
+            # typed, so #f and 0 or #t and 1 get different entries
+            key = (proc, tuple([(a.__class__, a) for a in args]))
+            try:
+                value = self.memo.lookup(key, _missing)
+            except TypeError:
+                # unhashable args, e.g. lists, are not memoized
+                proc.apply(self, args)
+                return
+            if value is not _missing:
+                self.done(value)
+                return
+            # memoized calls are not tail calls, the frame keeps the key
+            self.push_k(KMemo(self.env, key))
         proc.apply(self, args)
 
-    def do_primitive(self, name, args):
-        prim = getattr(self, f'prim_{name}')
-        self.done(prim(*args))
+    def capture_k(self):
+        return Continuation(self.stack.capture())
+
+    def call_cc(self, proc):
+        k = self.capture_k()
+        self.push_k(KApply(self.env, proc))
+        return k
+
+    def do_primitive(self, prim, args):
+        self.done(prim.fn(self, *args))
 
     def visit(self, ast):
         return ast.visit(self)
@@ -152,13 +452,63 @@ class Interpreter(Primitives):
         self.env = frame.env
         frame.step(self, a_value)
 
+    def bind_let(self, a_let, i, b_vals):
+        b_exprs = a_let.b_exprs
+        n = len(b_exprs)
+        while i < n:
+            b_expr = b_exprs[i]
+            if not b_expr.is_atomic:
+                self.push_k(KLet(self.env, b_vals, i, a_let))
+                self.doing(b_expr)
+                return
+            b_vals = (b_expr.atomic_eval(self), b_vals)
+            i += 1
+        self.extend_env(a_let, cons_to_list(b_vals, n))
+        self.doing(a_let.body)
+
     def visit_let(self, a_let):
-        self.push_k(KLet(self.env, [], a_let))
-        self.doing(a_let.b_exprs[0])
+        self.bind_let(a_let, 0, None)
+
+    def visit_letprim(self, a_let):
+        vals = [self.inline_eval(e) for e in a_let.b_exprs]
+        self.extend_env(a_let, vals)
+        self.doing(a_let.body)
+
+    def visit_primif(self, a_primif):
+        vals = [self.inline_eval(e) for e in a_primif.b_exprs]
+        self.extend_env(a_primif, vals)
+        if self.atomic_eval(a_primif.test) is not False:
+            self.doing(a_primif.conseq)
+        else:
+            self.doing(a_primif.alter)
+
+    def visit_letapp(self, a_let):
+        self.push_k(KLetApp(self.env, a_let))
+        self.visit_app(a_let.app)
+
+    def visit_letrec(self, a_letrec):
+        self.extend_env(a_letrec, [undefined] * len(a_letrec.b_vars))
+        closures = [self.make_closure(l) for l in a_letrec.b_exprs]
+        self.env.fill(a_letrec, closures)
+        self.doing(a_letrec.body)
 
     def visit_lambda(self, a_lambda):
         self.done(self.make_closure(a_lambda))
 
+    def visit_lexref(self, a_ref):
+        self.done(self.env.lookup(a_ref.depth, a_ref.slot))
+
+    def visit_globalref(self, a_ref):
+        self.done(self.global_env.get(a_ref.name))
+
+    def visit_resolved(self, a_resolved):
+        let_vars = a_resolved.let_vars
+        self.env = FrameEnv(self.env, let_vars, [undefined] * len(let_vars))
+        self.doing(a_resolved.body)
+
+    def visit_flatlambda(self, a_lambda):
+        self.done(self.make_flat_closure(a_lambda))
+
     def visit_datum(self, a_datum):
         self.done(a_datum.value)
 
@@ -179,9 +529,261 @@ class Interpreter(Primitives):
 
     def visit_primapp(self, a_primapp):
         rands = [a.atomic_eval(self) for a in a_primapp.rands]
-        self.do_primitive(a_primapp.name, rands)
+        self.do_primitive(a_primapp.prim, rands)
 
     def visit_app(self, an_app):
         rator = an_app.rator.atomic_eval(self)
         rands = [a.atomic_eval(self) for a in an_app.rands]
-        self.apply_procedure(rator, rands)
+        if rator.__class__ is Closure and (self.memo is None or
+                                           not rator.ast.pure):
+            a_lambda = rator.ast
+            if a_lambda is not an_app.callee:
+                # the rand count is fixed per site, so a hit needs no check
+                check_arity(a_lambda, rands)
+                an_app.callee = a_lambda
+            self.enter_closure(rator, rands)
+        else:
+            self.apply_procedure(rator, rands)
+
+
+_OP_LET    = 0
+_OP_LAMBDA = 1
+_OP_DATUM  = 2
+_OP_REF    = 3
+_OP_SEQ    = 4
+_OP_IF     = 5
+_OP_PRIM   = 6
+_OP_APP    = 7
+_OP_LEXREF = 8
+_OP_FLAT   = 9
+_OP_LETPRIM = 10
+_OP_PRIMIF = 11
+_OP_LETAPP = 12
+_OP_OTHER  = 13
+
+_EXPR_OPS = {
+    LetExpr: _OP_LET,
+    LambdaExpr: _OP_LAMBDA,
+    DatumExpr: _OP_DATUM,
+    RefExpr: _OP_REF,
+    SeqExpr: _OP_SEQ,
+    IfExpr: _OP_IF,
+    PrimAppExpr: _OP_PRIM,
+    AppExpr: _OP_APP,
+    LexRefExpr: _OP_LEXREF,
+    FlatLambdaExpr: _OP_FLAT,
+    LetPrimExpr: _OP_LETPRIM,
+    PrimIfExpr: _OP_PRIMIF,
+    LetAppExpr: _OP_LETAPP,
+}
+
+_K_HALT  = 0
+_K_LET   = 1
+_K_SEQ   = 2
+_K_LETAPP = 3
+_K_OTHER = 4
+
+_FRAME_OPS = {
+    KHalt: _K_HALT,
+    KLet: _K_LET,
+    KSeq: _K_SEQ,
+    KLetApp: _K_LETAPP,
+}
+
+
+def atomic_value(intp, env, an_aexp):
+    cls = an_aexp.__class__
+    if cls is DatumExpr:
+        return an_aexp.value
+    if cls is LexRefExpr:
+        return env.lookup(an_aexp.depth, an_aexp.slot)
+    if cls is RefExpr:
+        return env.get(an_aexp.name)
+    intp.env = env
+    return an_aexp.atomic_eval(intp)
+
+
+def inline_value(intp, env, an_exp):
+    if an_exp.__class__ is PrimAppExpr:
+        rands = [atomic_value(intp, env, a) for a in an_exp.rands]
+        return an_exp.prim.fn(intp, *rands)
+    return atomic_value(intp, env, an_exp)
+
+
+class RegisterInterpreter(Interpreter):
+    # Runs the same machine as Interpreter, but keeps the control, value,
+    # env and continuation registers in locals and dispatches through the
+    # per-class tables above instead of allocating Doing/Done states.
+    # Anything without a fast path falls back to the generic step.
+
+    # called before every step when set, see TracingRegisterInterpreter
+    trace_step = None
+
+    def load_registers(self):
+        state = self.state
+        if isinstance(state, Doing):
+            return state.ast, None, self.env, self.stack.frames
+        return None, state.value, self.env, self.stack.frames
+
+    def store_registers(self, env, frames):
+        self.env = env
+        self.stack.frames = frames
+
+    def run(self, max_steps=None):
+        if self.halt:
+            self.last_steps = 0
+            return self.state.value
+        ast, value, env, frames = self.load_registers()
+        expr_ops = _EXPR_OPS
+        frame_ops = _FRAME_OPS
+        memo = self.memo
+        trace_step = self.trace_step
+        fuel = -1 if max_steps is None else max_steps
+        start = fuel
+        try:
+            while True:
+                if fuel == 0:
+                    self.store_registers(env, frames)
+                    if ast is not None:
+                        self.doing(ast)
+                    else:
+                        self.done(value)
+                    return Suspended(self)
+                fuel -= 1
+                if trace_step is not None:
+                    trace_step(ast, frames)
+                if ast is not None:
+                    op = expr_ops.get(ast.__class__, _OP_OTHER)
+                    if op == _OP_LET:
+                        # same as Interpreter.bind_let, also in _K_LET below
+                        let_ast = ast
+                        b_exprs = let_ast.b_exprs
+                        b_vals = None
+                        i = 0
+                        n = len(b_exprs)
+                        while i < n:
+                            ast = b_exprs[i]
+                            if not ast.is_atomic:
+                                frames = (KLet(env, b_vals, i, let_ast), frames)
+                                break
+                            b_vals = (atomic_value(self, env, ast), b_vals)
+                            i += 1
+                        else:
+                            env = env.bind(let_ast, cons_to_list(b_vals, n))
+                            ast = let_ast.body
+                    elif op == _OP_LEXREF:
+                        value = env.lookup(ast.depth, ast.slot)
+                        ast = None
+                    elif op == _OP_PRIMIF:
+                        vals = [inline_value(self, env, e) for e in ast.b_exprs]
+                        env = env.bind(ast, vals)
+                        if atomic_value(self, env, ast.test) is not False:
+                            ast = ast.conseq
+                        else:
+                            ast = ast.alter
+                    elif op == _OP_LETPRIM:
+                        vals = [inline_value(self, env, e) for e in ast.b_exprs]
+                        env = env.bind(ast, vals)
+                        ast = ast.body
+                    elif op == _OP_LETAPP:
+                        frames = (KLetApp(env, ast), frames)
+                        ast = ast.app
+                    elif op == _OP_REF:
+                        value = env.get(ast.name)
+                        ast = None
+                    elif op == _OP_DATUM:
+                        value = ast.value
+                        ast = None
+                    elif op == _OP_IF:
+                        if atomic_value(self, env, ast.test) is not False:
+                            ast = ast.conseq
+                        else:
+                            ast = ast.alter
+                    elif op == _OP_PRIM:
+                        rands = [atomic_value(self, env, a) for a in ast.rands]
+                        prim = ast.prim
+                        if prim.control:
+                            self.store_registers(env, frames)
+                            value = prim.fn(self, *rands)
+                            frames = self.stack.frames
+                            if self.pending is not None:
+                                self.store_registers(env, frames)
+                                self.done(value)
+                                return Suspended(self)
+                        else:
+                            value = prim.fn(self, *rands)
+                        ast = None
+                    elif op == _OP_APP:
+                        rator = atomic_value(self, env, ast.rator)
+                        rands = [atomic_value(self, env, a) for a in ast.rands]
+                        if rator.__class__ is Closure and (memo is None or
+                                                           not rator.ast.pure):
+                            a_lambda = rator.ast
+                            if a_lambda is not ast.callee:
+                                check_arity(a_lambda, rands)
+                                ast.callee = a_lambda
+                            env = rator.env.enter(a_lambda, rands)
+                            ast = a_lambda.body
+                        else:
+                            self.store_registers(env, frames)
+                            self.apply_procedure(rator, rands)
+                            ast, value, env, frames = self.load_registers()
+                    elif op == _OP_FLAT:
+                        vals = [atomic_value(self, env, r) for r in ast.free_refs]
+                        value = Closure(FrameEnv(self.global_env, ast.free_vars, vals), ast)
+                        ast = None
+                    elif op == _OP_LAMBDA:
+                        value = Closure(env, ast)
+                        ast = None
+                    elif op == _OP_SEQ:
+                        if len(ast.exprs) > 1:
+                            frames = (KSeq(env, ast, 1), frames)
+                        ast = ast.exprs[0]
+                    else:
+                        self.store_registers(env, frames)
+                        self.doing(ast)
+                        self.step()
+                        ast, value, env, frames = self.load_registers()
+                else:
+                    frame, frames = frames
+                    env = frame.env
+                    op = frame_ops.get(frame.__class__, _K_OTHER)
+                    if op == _K_LET:
+                        let_ast = frame.ast
+                        b_exprs = let_ast.b_exprs
+                        b_vals = (value, frame.bind_vals)
+                        i = frame.i + 1
+                        n = len(b_exprs)
+                        while i < n:
+                            ast = b_exprs[i]
+                            if not ast.is_atomic:
+                                frames = (KLet(env, b_vals, i, let_ast), frames)
+                                break
+                            b_vals = (atomic_value(self, env, ast), b_vals)
+                            i += 1
+                        else:
+                            env = env.bind(let_ast, cons_to_list(b_vals, n))
+                            ast = let_ast.body
+                    elif op == _K_LETAPP:
+                        let_ast = frame.ast
+                        env = env.bind(let_ast, [value])
+                        ast = let_ast.body
+                    elif op == _K_SEQ:
+                        seq_ast = frame.ast
+                        ast = seq_ast.exprs[frame.i]
+                        next_i = frame.i + 1
+                        if next_i < len(seq_ast.exprs):
+                            frames = (KSeq(env, seq_ast, next_i), frames)
+                    elif op == _K_HALT:
+                        break
+                    else:
+                        self.store_registers(env, frames)
+                        self.done(value)
+                        frame.step(self, value)
+                        ast, value, env, frames = self.load_registers()
+        finally:
+            self.last_steps = start - fuel
+        self.store_registers(env, frames)
+        self.halt = True
+        self.done(value)
+        return value
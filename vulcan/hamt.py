@@ -1,230 +1,341 @@
+_TRIE_MASK_WIDTH = 4
+_TRIE_MASK       = 0xF
+_HASH_BITS       = 64
+_HASH_MASK       = (1 << _HASH_BITS) - 1
+
+
+def mix_hash(key):
+    # hash(key) run through the murmur3 finalizer, so small ints and
+    # other clustered hashes still spread over every level of the trie
+    h = hash(key) & _HASH_MASK
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & _HASH_MASK
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & _HASH_MASK
+    h ^= h >> 33
+    return h
 
 
-class SVector:
+class Node:
+    # A CHAMP node.  Bit i of datamap marks a key/value pair stored
+    # inline for hash digit i, bit i of nodemap a subtree.  content holds
+    # the pairs flat (k0, v0, k1, v1, ...) followed by the subtrees, each
+    # group in digit order, so a slot is found by popcount of the lower
+    # bits.  Subtrees always hold at least two entries, which keeps the
+    # shape of a trie a function of its keys alone.
+    __slots__ = ('datamap', 'nodemap', 'content')
     is_leaf = False
 
-    def __init__(self, mask, slots):
-        mask = mask & ((1 << 64) - 1)
-        n = mask.bit_count()
-        if n != len(slots):
-            raise Exception(f'mask ({n}) and number of slots ({len(slots)}) do not match')
-        self.mask = mask
-        self.slots = slots
-
-    def has_child(self, i):
-        m = 1 << i
-        return self.mask & m != 0
-
-    def child_index(self, i):
-        # PRE: i is a valid index from the mask
-        v = (1 << i) - 1
-        return (self.mask & v).bit_count()
-
-    def update(self, rm, am, add_slots):
-        # XXX: validate masks
-        nm0 = (self.mask & ~rm) | am
-        size = nm0.bit_count()
-        new_slots = [None] * size
-        i = 0
-        j = 0
-        k = 0
-        nm = nm0
-        replace_m = nm & am & rm
-        add_m = nm & am & ~rm
-        copy_m = nm & ~am & ~rm
-        remove_m = ~nm & ~am & rm
-
-        while nm != 0:
-            if replace_m & 1 == 1:
-                i += 1
-                new_slots[j] = add_slots[k]
-                j += 1
-                k += 1
-            elif add_m & 1 == 1:
-                new_slots[j] = add_slots[k]
-                j += 1
-                k += 1
-            elif copy_m & 1 == 1:
-                new_slots[j] = self.slots[i]
-                i += 1
-                j += 1
-            elif remove_m & 1 == 1:
-                i += 1
-
-            nm = nm >> 1
-            replace_m = replace_m >> 1
-            add_m = add_m >> 1
-            copy_m = copy_m >> 1
-            remove_m = remove_m >> 1
-        return SVector(nm0, new_slots)
-
-    def __contains__(self, i):
-        return self.has_child(i)
-
-    def __getitem__(self, i):
-        if self.has_child(i):
-            j = self.child_index(i)
-            return self.slots[j]
-        else:
-            return None
-
-
-_BRANCH_FACTOR   = 16
-_TRIE_MASK_WIDTH = 4
-_TRIE_MASK       = 0xF
-_COUNT_POS       = 0
-_SUBTREE_POS     = 1
-_KEY_POS         = _SUBTREE_POS + _BRANCH_FACTOR
-_VALUE_POS       = _KEY_POS + _BRANCH_FACTOR
+    def __init__(self, datamap, nodemap, content):
+        self.datamap = datamap
+        self.nodemap = nodemap
+        self.content = content
+
+    def data_index(self, bit):
+        return 2 * (self.datamap & (bit - 1)).bit_count()
+
+    def node_index(self, bit):
+        return (2 * self.datamap.bit_count() +
+                (self.nodemap & (bit - 1)).bit_count())
+
+    def single(self):
+        # the only pair of a node that has one pair and no subtrees
+        if self.nodemap == 0 and self.datamap.bit_count() == 1:
+            return self.content[0], self.content[1]
+        return None
+
+    def items(self):
+        content = self.content
+        n = 2 * self.datamap.bit_count()
+        for i in range(0, n, 2):
+            yield content[i], content[i + 1]
+        for i in range(n, len(content)):
+            yield from content[i].items()
+
+
+class Collision:
+    # Keys whose mixed hashes are equal in all 64 bits, kept below the
+    # last level of the trie as a flat (k0, v0, k1, v1, ...) tuple.
+    __slots__ = ('key_hash', 'content')
+    is_leaf = True
+
+    def __init__(self, key_hash, content):
+        self.key_hash = key_hash
+        self.content = content
+
+    def find(self, key):
+        content = self.content
+        for i in range(0, len(content), 2):
+            if content[i] == key:
+                return i
+        return -1
+
+    def single(self):
+        if len(self.content) == 2:
+            return self.content[0], self.content[1]
+        return None
+
+    def items(self):
+        content = self.content
+        for i in range(0, len(content), 2):
+            yield content[i], content[i + 1]
+
+    def insert(self, key, value):
+        i = self.find(key)
+        if i < 0:
+            return Collision(self.key_hash, self.content + (key, value)), True
+        if self.content[i + 1] is value:
+            return self, False
+        content = self.content[:i + 1] + (value,) + self.content[i + 2:]
+        return Collision(self.key_hash, content), False
+
+    def lookup(self, key, fk, sk):
+        i = self.find(key)
+        if i < 0:
+            return fk()
+        return sk(self.content[i], self.content[i + 1])
+
+    def remove(self, key):
+        i = self.find(key)
+        if i < 0:
+            return self
+        return Collision(self.key_hash, self.content[:i] + self.content[i + 2:])
+
+
+def make_node2(ak, av, ah, bk, bv, bh, shift):
+    if shift >= _HASH_BITS:
+        return Collision(ah, (ak, av, bk, bv))
+    ai = (ah >> shift) & _TRIE_MASK
+    bi = (bh >> shift) & _TRIE_MASK
+    if ai == bi:
+        child = make_node2(ak, av, ah, bk, bv, bh, shift + _TRIE_MASK_WIDTH)
+        return Node(0, 1 << ai, (child,))
+    if bi < ai:
+        ak, av, bk, bv = bk, bv, ak, av
+    return Node((1 << ai) | (1 << bi), 0, (ak, av, bk, bv))
+
+
+def nodes_equal(a, b):
+    if a is b:
+        return True
+    if a.is_leaf or b.is_leaf:
+        return a.is_leaf and b.is_leaf and dict(a.items()) == dict(b.items())
+    if a.datamap != b.datamap or a.nodemap != b.nodemap:
+        return False
+    n = 2 * a.datamap.bit_count()
+    if a.content[:n] != b.content[:n]:
+        return False
+    return all(nodes_equal(x, y) for x, y in zip(a.content[n:], b.content[n:]))
+
+
+_EMPTY = Node(0, 0, ())
+
 
 class Hamt:
-    def __init__(self, root=None):
+    def __init__(self, root=None, size=0):
         if root is None:
-            root = SVector(1, [0])
+            root = _EMPTY
         self.root = root
+        self.size = size
+
+    @classmethod
+    def from_items(cls, items):
+        return HamtBuilder().update(items).freeze()
+
+    def update_many(self, items):
+        return HamtBuilder(self).update(items).freeze()
+
+    def transient(self):
+        return HamtBuilder(self)
 
     def count(self):
-        return self.root[_COUNT_POS]
-
-    def _find_insert(self, key, value, key_hash, node, depth):
-        if key_hash == 0:
-            raise Exception("out of hash bits")
-
-        i = key_hash & _TRIE_MASK
-        ti = _SUBTREE_POS + i
-        if ti in node:
-            changed, child = self._find_insert(key,
-                                               value,
-                                               key_hash >> _TRIE_MASK_WIDTH,
-                                               node[ti],
-                                               depth + 1)
-            if changed:
-                m = (1 << _COUNT_POS) | (1 << ti)
-                return True, node.update(m, m, [node[_COUNT_POS] + 1, child])
-            else:
-                return False, node
-        else:
-            ki = _KEY_POS + i
-            vi = _VALUE_POS + i
-            if ki in node:
-                # replace or split
-                old_key = node[ki]
-                if old_key == key:
-                    old_value = node[vi]
-                    if old_value == value:
-                        # same key/value don't change
-                        return False, node
-                    # replace key/value
-                    m = (1 << ki) | (1 << vi)
-                    return True, node.update(m, m, [key, value])
-                # split value
-                old_key = node[ki]
-                old_value = node[vi]
-                old_hash = hash(old_key) & ((1 << 64) - 1)
-                old_hash = old_hash >> ((depth + 1) * _TRIE_MASK_WIDTH)
-                key_hash = key_hash >> _TRIE_MASK_WIDTH
-                child = self.make_node2(old_key, old_value, old_hash,
-                                        key, value, key_hash)
-                rm = (1 << _COUNT_POS) | (1 << ki) | (1 << vi)
-                am = (1 << _COUNT_POS) | (1 << ti)
-                return True, node.update(rm, am, [node[_COUNT_POS] + 1, child])
-            # insert key/value into node
-            rm = 1 << _COUNT_POS
-            am = (1 << _COUNT_POS) | (1 << ki) | (1 << vi)
-            return True, node.update(rm, am, [node[_COUNT_POS] + 1, key, value])
-
-    def make_node2(self, ak, av, ah, bk, bv, bh):
-        ai = ah & _TRIE_MASK
-        bi = bh & _TRIE_MASK
-        if bi < ai:
-            return self.make_node2(bk, bv, bh, ak, av, ah)
-        elif bi == ai:
-            child = self.make_node2(ak, av, ah >> _TRIE_MASK_WIDTH,
-                                    bk, bv, bh >> _TRIE_MASK_WIDTH)
-            ti = _SUBTREE_POS + ai
-            m = (1 << _COUNT_POS) | (1 << ti)
-            return SVector(m, [2, child])
-        aki = _KEY_POS + ai
-        bki = _KEY_POS + bi
-        avi = _VALUE_POS + ai
-        bvi = _VALUE_POS + bi
-        m = ((1 << _COUNT_POS) |
-             (1 << aki) | (1 << avi) |
-             (1 << bki) | (1 << bvi))
-        return SVector(m, [2, ak, bk, av, bv])
+        return self.size
+
+    def __len__(self):
+        return self.size
+
+    def items(self):
+        return self.root.items()
+
+    def __eq__(self, other):
+        # canonical shapes, equal maps have the same nodes
+        if not isinstance(other, Hamt):
+            return NotImplemented
+        return self.size == other.size and nodes_equal(self.root, other.root)
+
+    __hash__ = None
+
+    def _find_insert(self, key, value, key_hash, node, shift):
+        # returns the new node (node itself when nothing changed) and
+        # whether the key was added rather than replaced
+        if node.is_leaf:
+            return node.insert(key, value)
+
+        bit = 1 << ((key_hash >> shift) & _TRIE_MASK)
+        content = node.content
+        if node.datamap & bit:
+            i = node.data_index(bit)
+            old_key = content[i]
+            old_value = content[i + 1]
+            if old_key == key:
+                if old_value is value:
+                    # same key/value don't change
+                    return node, False
+                # replace the value
+                content = content[:i + 1] + (value,) + content[i + 2:]
+                return Node(node.datamap, node.nodemap, content), False
+            # split: the pair moves down into a new subtree
+            child = make_node2(old_key, old_value, mix_hash(old_key),
+                               key, value, key_hash, shift + _TRIE_MASK_WIDTH)
+            datamap = node.datamap ^ bit
+            nodemap = node.nodemap | bit
+            j = node.node_index(bit)
+            content = content[:i] + content[i + 2:j] + (child,) + content[j:]
+            return Node(datamap, nodemap, content), True
+        if node.nodemap & bit:
+            j = node.node_index(bit)
+            child, added = self._find_insert(key, value, key_hash, content[j],
+                                             shift + _TRIE_MASK_WIDTH)
+            if child is content[j]:
+                return node, False
+            content = content[:j] + (child,) + content[j + 1:]
+            return Node(node.datamap, node.nodemap, content), added
+        # add the pair
+        i = node.data_index(bit)
+        content = content[:i] + (key, value) + content[i:]
+        return Node(node.datamap | bit, node.nodemap, content), True
 
     def insert(self, key, value):
-        key_hash = hash(key) & ((1 << 64) - 1)
-        changed, next_root = self._find_insert(key, value, key_hash, self.root, 0)
-        if changed:
-            return Hamt(next_root)
-        return self
+        next_root, added = self._find_insert(key, value, mix_hash(key),
+                                             self.root, 0)
+        if next_root is self.root:
+            return self
+        return Hamt(next_root, self.size + added)
 
     def lookup(self, key, fk, sk):
-        key_hash = hash(key) & ((1 << 64) - 1)
+        key_hash = mix_hash(key)
         node = self.root
-        i = key_hash & _TRIE_MASK
-        ti = _SUBTREE_POS + i
-        while ti in node:
-            node = node[ti]
+        while True:
+            if node.is_leaf:
+                return node.lookup(key, fk, sk)
+            bit = 1 << (key_hash & _TRIE_MASK)
+            if node.datamap & bit:
+                i = 2 * (node.datamap & (bit - 1)).bit_count()
+                found_key = node.content[i]
+                if found_key == key:
+                    return sk(found_key, node.content[i + 1])
+                return fk()
+            if not node.nodemap & bit:
+                return fk()
+            node = node.content[node.node_index(bit)]
             key_hash = key_hash >> _TRIE_MASK_WIDTH
-            if key_hash == 0:
-                raise Exception("out of hash bits")
-            i = key_hash & _TRIE_MASK
-            ti = _SUBTREE_POS + i
-        ki = _KEY_POS + i
-        if ki in node:
-            found_key = node[ki]
-            if found_key == key:
-                # node has the right key
-                vi = _VALUE_POS + i
-                return sk(found_key, node[vi])
-        # node has the wrong key OR
-        # node doesn't have key
-        return fk()
-
-    def _find_remove(self, key, key_hash, node):
-        if key_hash == 0:
-            raise Exception("out of hash bits")
-
-        i = key_hash & _TRIE_MASK
-        ti = _SUBTREE_POS + i
-        if ti in node:
-            changed, child = self._find_remove(key,
-                                               key_hash >> _TRIE_MASK_WIDTH,
-                                               node[ti])
-            if changed:
-                m = (1 << _COUNT_POS) | (1 << ti)
-                if child is None:
-                    # remove this child
-                    if node[_COUNT_POS] == 1:
-                        # no subtrees and no key/values
-                        # remove entire node
-                        return True, None
-                    return True, node.update(m, 1 << _COUNT_POS, [node[_COUNT_POS] - 1])
-                # swap child
-                return True, node.update(m, m, [node[_COUNT_POS] - 1, child])
-            return False, node
-
-        ki = _KEY_POS + i
-        if ki in node:
-            if key == node[ki]:
-                if node[_COUNT_POS] == 1:
-                    # no subtrees and no key/values
-                    # remove entire node
-                    return True, None
-                # remove key/value from node
-                vi = _VALUE_POS + i
-                rm = (1 << _COUNT_POS) | (1 << ki) | (1 << vi)
-                am = (1 << _COUNT_POS)
-                return True, node.update(rm, am, [node[_COUNT_POS] - 1])
-            # no change: key doesn't match
-        # no change: no key here
-        return False, node
+
+    def _find_remove(self, key, key_hash, node, shift):
+        # returns the new node, node itself when key is missing
+        if node.is_leaf:
+            return node.remove(key)
+
+        bit = 1 << ((key_hash >> shift) & _TRIE_MASK)
+        content = node.content
+        if node.datamap & bit:
+            i = node.data_index(bit)
+            if content[i] != key:
+                return node
+            content = content[:i] + content[i + 2:]
+            return Node(node.datamap ^ bit, node.nodemap, content)
+        if node.nodemap & bit:
+            j = node.node_index(bit)
+            child = self._find_remove(key, key_hash, content[j],
+                                      shift + _TRIE_MASK_WIDTH)
+            if child is content[j]:
+                return node
+            pair = child.single()
+            if pair is None:
+                content = content[:j] + (child,) + content[j + 1:]
+                return Node(node.datamap, node.nodemap, content)
+            # a subtree left with one pair is inlined again
+            i = node.data_index(bit)
+            content = content[:i] + pair + content[i:j] + content[j + 1:]
+            return Node(node.datamap | bit, node.nodemap ^ bit, content)
+        return node
 
     def remove(self, key):
-        key_hash = hash(key) & ((1 << 64) - 1)
-        changed, next_root = self._find_remove(key, key_hash, self.root)
-        if changed:
-            return Hamt(next_root)
+        next_root = self._find_remove(key, mix_hash(key), self.root, 0)
+        if next_root is self.root:
+            return self
+        return Hamt(next_root, self.size - 1)
+
+
+class HamtBuilder:
+    # A transient Hamt for bulk loads.  Nodes in owned were made by this
+    # builder and are updated in place, their content a list until
+    # freeze; any other node is copied (and owned) the first time an
+    # insert touches it, so the Hamt the builder started from is never
+    # changed.  freeze hands the trie out as a Hamt and gives up
+    # ownership, after which its nodes are copied like any others.
+    def __init__(self, a_hamt=None):
+        if a_hamt is None:
+            a_hamt = Hamt()
+        self.root = a_hamt.root
+        self.size = a_hamt.size
+        self.owned = set()
+
+    def count(self):
+        return self.size
+
+    def own(self, node):
+        if node in self.owned:
+            return node
+        copy = Node(node.datamap, node.nodemap, list(node.content))
+        self.owned.add(copy)
+        return copy
+
+    def _insert(self, key, value, key_hash, node, shift):
+        # returns the node to store in the parent and whether key was added
+        if node.is_leaf:
+            return node.insert(key, value)
+        node = self.own(node)
+        content = node.content
+        bit = 1 << ((key_hash >> shift) & _TRIE_MASK)
+        if node.datamap & bit:
+            i = node.data_index(bit)
+            old_key = content[i]
+            if old_key == key:
+                content[i + 1] = value
+                return node, False
+            # split: the pair moves down into a new subtree
+            child = make_node2(old_key, content[i + 1], mix_hash(old_key),
+                               key, value, key_hash, shift + _TRIE_MASK_WIDTH)
+            j = node.node_index(bit)
+            content.insert(j, child)
+            del content[i:i + 2]
+            node.datamap ^= bit
+            node.nodemap |= bit
+            return node, True
+        if node.nodemap & bit:
+            j = node.node_index(bit)
+            content[j], added = self._insert(key, value, key_hash, content[j],
+                                             shift + _TRIE_MASK_WIDTH)
+            return node, added
+        i = node.data_index(bit)
+        content[i:i] = (key, value)
+        node.datamap |= bit
+        return node, True
+
+    def insert(self, key, value):
+        self.root, added = self._insert(key, value, mix_hash(key), self.root, 0)
+        self.size += added
         return self
+
+    def update(self, items):
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            self.insert(key, value)
+        return self
+
+    def freeze(self):
+        for node in self.owned:
+            node.content = tuple(node.content)
+        self.owned = set()
+        return Hamt(self.root, self.size)
@@ -0,0 +1,162 @@
+from .ast import (AppExpr, DatumExpr, IfExpr, LambdaExpr, LetExpr, LetRecExpr,
+                  PrimAppExpr, RefExpr, SeqExpr)
+from .type import undefined
+
+
+def is_undefined_box(ast):
+    return (isinstance(ast, PrimAppExpr) and ast.name == 'box' and
+            len(ast.rands) == 1 and isinstance(ast.rands[0], DatumExpr) and
+            ast.rands[0].value is undefined)
+
+
+def is_set_lambda(ast, names):
+    return (isinstance(ast, PrimAppExpr) and ast.name == 'set_box' and
+            len(ast.rands) == 2 and isinstance(ast.rands[0], RefExpr) and
+            ast.rands[0].name in names and isinstance(ast.rands[1], LambdaExpr))
+
+
+class Unboxer:
+    # Rewrites (#%prim unbox b) to b for the boxes in names.  Any other
+    # use of one of those boxes is recorded in bad.
+    def __init__(self, names):
+        self.names = names
+        self.bad = set()
+
+    def rewrite(self, ast, names):
+        return ast.visit(self, names)
+
+    def rewrite_all(self, asts, names):
+        return [self.rewrite(a, names) for a in asts]
+
+    def visit_let(self, a_let, names):
+        b_exprs = self.rewrite_all(a_let.b_exprs, names)
+        body = self.rewrite(a_let.body, names - set(a_let.b_vars))
+        return LetExpr(a_let.b_vars, b_exprs, body)
+
+    def visit_letrec(self, a_letrec, names):
+        names = names - set(a_letrec.b_vars)
+        return LetRecExpr(a_letrec.b_vars,
+                          self.rewrite_all(a_letrec.b_exprs, names),
+                          self.rewrite(a_letrec.body, names))
+
+    def visit_seq(self, a_seq, names):
+        return SeqExpr(self.rewrite_all(a_seq.exprs, names))
+
+    def visit_ref(self, a_ref, names):
+        if a_ref.name in names:
+            self.bad.add(a_ref.name)
+        return a_ref
+
+    # pylint: disable=unused-argument
+    def visit_datum(self, a_datum, names):
+        return a_datum
+
+    def visit_if(self, an_if, names):
+        return IfExpr(self.rewrite(an_if.test, names),
+                      self.rewrite(an_if.conseq, names),
+                      self.rewrite(an_if.alter, names))
+
+    def visit_lambda(self, a_lambda, names):
+        body = self.rewrite(a_lambda.body, names - set(a_lambda.args))
+        return LambdaExpr(a_lambda.args, body)
+
+    def visit_primapp(self, a_primapp, names):
+        if a_primapp.name == 'unbox' and len(a_primapp.rands) == 1:
+            rand = a_primapp.rands[0]
+            if isinstance(rand, RefExpr) and rand.name in names:
+                return rand
+        return PrimAppExpr(a_primapp.name, self.rewrite_all(a_primapp.rands, names),
+                           a_primapp.prim)
+
+    def visit_app(self, an_app, names):
+        return AppExpr(self.rewrite(an_app.rator, names),
+                       self.rewrite_all(an_app.rands, names))
+
+
+class BoxEliminator:
+    # Finds the letrec pattern
+    #
+    #   (#%let ([b (#%prim box (#%datum #undefined))] ...)
+    #     (#%prim set_box b (#%lambda ...)) ...
+    #     rest ...)
+    #
+    # where each box is set once, to a lambda, before anything else runs,
+    # and is otherwise only unboxed.  Those boxes become a LetRecExpr
+    # around the rest of the body and their unboxes become references.
+    def eliminate(self, ast):
+        return ast.visit(self)
+
+    def eliminate_all(self, asts):
+        return [self.eliminate(a) for a in asts]
+
+    def visit_let(self, a_let):
+        b_exprs = self.eliminate_all(a_let.b_exprs)
+        body = self.eliminate(a_let.body)
+        b_vars = a_let.b_vars
+        if isinstance(body, SeqExpr):
+            boxes = {v for v, e in zip(b_vars, b_exprs)
+                     if is_undefined_box(e) and b_vars.count(v) == 1}
+            rewritten = self.rewrite_body(boxes, body.exprs)
+            if rewritten is not None:
+                boxes, body = rewritten
+                kept = [(v, e) for v, e in zip(b_vars, b_exprs) if v not in boxes]
+                if not kept:
+                    return body
+                return LetExpr([v for v, _ in kept], [e for _, e in kept], body)
+        return LetExpr(b_vars, b_exprs, body)
+
+    def rewrite_body(self, boxes, exprs):
+        sets = {}
+        i = 0
+        while (i < len(exprs) - 1 and is_set_lambda(exprs[i], boxes) and
+               exprs[i].rands[0].name not in sets):
+            sets[exprs[i].rands[0].name] = exprs[i].rands[1]
+            i += 1
+        names = set(sets)
+        while names:
+            unboxer = Unboxer(names)
+            lambdas = {n: unboxer.rewrite(sets[n], names) for n in names}
+            others = [e for e in exprs[:i] if e.rands[0].name not in names]
+            rest = unboxer.rewrite_all(others + exprs[i:], names)
+            if not unboxer.bad:
+                b_vars = [n for n in sets if n in names]
+                body = rest[0] if len(rest) == 1 else SeqExpr(rest)
+                return names, LetRecExpr(b_vars, [lambdas[n] for n in b_vars], body)
+            names = names - unboxer.bad
+        return None
+
+    def visit_letrec(self, a_letrec):
+        return LetRecExpr(a_letrec.b_vars,
+                          self.eliminate_all(a_letrec.b_exprs),
+                          self.eliminate(a_letrec.body))
+
+    def visit_seq(self, a_seq):
+        return SeqExpr(self.eliminate_all(a_seq.exprs))
+
+    def visit_ref(self, a_ref):
+        return a_ref
+
+    def visit_datum(self, a_datum):
+        return a_datum
+
+    def visit_if(self, an_if):
+        return IfExpr(an_if.test,
+                      self.eliminate(an_if.conseq),
+                      self.eliminate(an_if.alter))
+
+    def visit_lambda(self, a_lambda):
+        return LambdaExpr(a_lambda.args, self.eliminate(a_lambda.body))
+
+    def visit_primapp(self, a_primapp):
+        return PrimAppExpr(a_primapp.name, self.eliminate_all(a_primapp.rands),
+                           a_primapp.prim)
+
+    def visit_app(self, an_app):
+        return AppExpr(self.eliminate(an_app.rator), self.eliminate_all(an_app.rands))
+
+    def visit_resolved(self, a_resolved):
+        return a_resolved
+
+
+def eliminate_boxes(ast):
+    return BoxEliminator().eliminate(ast)
@@ -0,0 +1,131 @@
+import sys
+
+from .ast import PrimAppExpr
+from .eval import Interpreter
+from .type import Continuation, unlink
+
+
+def approx_size(obj):
+    # the object, its attribute dict and the binds or vals of an env
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+        for name in ('binds', 'vals'):
+            if name in attrs:
+                size += sys.getsizeof(attrs[name])
+    return size
+
+
+class Limits:
+    # None means unlimited.  objects and bytes count every box, closure,
+    # env frame and continuation frame allocated during a run.
+    def __init__(self, max_objects=None, max_bytes=None, max_depth=None):
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+
+
+class HeapUsage:
+    def __init__(self):
+        self.counts = {'box': 0, 'closure': 0, 'env': 0, 'frame': 0}
+        self.objects = 0
+        self.bytes = 0
+        self.depth = 0
+        self.max_depth = 0
+
+    def as_dict(self):
+        usage = dict(self.counts)
+        usage.update(objects=self.objects, bytes=self.bytes,
+                     depth=self.depth, max_depth=self.max_depth)
+        return usage
+
+
+class ResourceLimitExceeded(Exception):
+    def __init__(self, resource, limit, usage):
+        super().__init__(f'{resource} limit of {limit} exceeded')
+        self.resource = resource
+        self.limit = limit
+        self.usage = usage
+
+
+class AccountingInterpreter(Interpreter):
+    # A CEK interpreter that counts what a program allocates and aborts
+    # it with ResourceLimitExceeded once a limit is passed.
+    def __init__(self, global_env=None, memo=None, limits=None):
+        super().__init__(global_env, memo)
+        self.limits = Limits() if limits is None else limits
+        self.usage = HeapUsage()
+
+    def account(self, kind, obj):
+        usage = self.usage
+        limits = self.limits
+        usage.counts[kind] += 1
+        usage.objects += 1
+        usage.bytes += approx_size(obj)
+        max_objects = limits.max_objects
+        if max_objects is not None and usage.objects > max_objects:
+            self.abort('objects', max_objects)
+        if limits.max_bytes is not None and usage.bytes > limits.max_bytes:
+            self.abort('bytes', limits.max_bytes)
+        return obj
+
+    def set_depth(self, depth):
+        usage = self.usage
+        usage.depth = depth
+        if depth > usage.max_depth:
+            usage.max_depth = depth
+            max_depth = self.limits.max_depth
+            if max_depth is not None and depth > max_depth:
+                self.abort('depth', max_depth)
+
+    def abort(self, resource, limit):
+        self.halt = True
+        raise ResourceLimitExceeded(resource, limit, self.usage.as_dict())
+
+    def load(self, ast):
+        # limits apply to each run on its own
+        self.usage = HeapUsage()
+        super().load(ast)
+
+    def push_k(self, k):
+        super().push_k(k)
+        self.account('frame', k)
+        self.set_depth(self.usage.depth + 1)
+
+    def ret(self, a_value):
+        self.usage.depth -= 1
+        super().ret(a_value)
+
+    def extend_env(self, a_let, vals):
+        env = self.env
+        super().extend_env(a_let, vals)
+        # a resolved let writes into the frame it runs in
+        if self.env is not env:
+            self.account('env', self.env)
+
+    def enter_closure(self, a_closure, vals):
+        super().enter_closure(a_closure, vals)
+        self.account('env', self.env)
+
+    def make_closure(self, a_lambda):
+        return self.account('closure', super().make_closure(a_lambda))
+
+    def make_flat_closure(self, a_lambda):
+        return self.account('closure', super().make_flat_closure(a_lambda))
+
+    def apply_procedure(self, proc, args):
+        super().apply_procedure(proc, args)
+        if proc.__class__ is Continuation:
+            self.set_depth(len(unlink(self.stack.frames)))
+
+    def do_primitive(self, prim, args):
+        super().do_primitive(prim, args)
+        if prim.name == 'box':
+            self.account('box', self.state.value)
+
+    def inline_eval(self, ast):
+        value = super().inline_eval(ast)
+        if isinstance(ast, PrimAppExpr) and ast.name == 'box':
+            self.account('box', value)
+        return value
@@ -0,0 +1,77 @@
+from .ast import (AppExpr, FlatLambdaExpr, IfExpr, LambdaExpr, LetAppExpr,
+                  LetExpr, LetPrimExpr, LetRecExpr, PrimAppExpr, PrimIfExpr,
+                  ResolvedExpr, SeqExpr)
+
+
+def is_inline(ast):
+    if ast.is_atomic:
+        return True
+    return isinstance(ast, PrimAppExpr) and not ast.prim.control
+
+
+class Lowerer:
+    # Rewrites the let/prim/if and let/app idioms into the fused
+    # LetPrimExpr, PrimIfExpr and LetAppExpr instructions run by the
+    # interpreters.  Run it last, after optimize and resolve.
+    def lower(self, ast):
+        return ast.visit(self)
+
+    def lower_all(self, asts):
+        return [self.lower(a) for a in asts]
+
+    def visit_let(self, a_let):
+        b_exprs = self.lower_all(a_let.b_exprs)
+        body = self.lower(a_let.body)
+        slot = a_let.slot
+        if all(is_inline(e) for e in b_exprs):
+            if isinstance(body, IfExpr):
+                return PrimIfExpr(a_let.b_vars, b_exprs,
+                                  body.test, body.conseq, body.alter, slot)
+            return LetPrimExpr(a_let.b_vars, b_exprs, body, slot)
+        if len(b_exprs) == 1 and isinstance(b_exprs[0], AppExpr):
+            return LetAppExpr(a_let.b_vars, b_exprs[0], body, slot)
+        return LetExpr(a_let.b_vars, b_exprs, body, slot)
+
+    def visit_letrec(self, a_letrec):
+        return LetRecExpr(a_letrec.b_vars,
+                          self.lower_all(a_letrec.b_exprs),
+                          self.lower(a_letrec.body),
+                          a_letrec.slot)
+
+    def visit_seq(self, a_seq):
+        return SeqExpr(self.lower_all(a_seq.exprs))
+
+    def visit_ref(self, a_ref):
+        return a_ref
+
+    visit_lexref = visit_ref
+    visit_globalref = visit_ref
+    visit_datum = visit_ref
+
+    def visit_if(self, an_if):
+        return IfExpr(an_if.test,
+                      self.lower(an_if.conseq),
+                      self.lower(an_if.alter))
+
+    def visit_lambda(self, a_lambda):
+        return LambdaExpr(a_lambda.args, self.lower(a_lambda.body),
+                          a_lambda.let_vars)
+
+    def visit_flatlambda(self, a_lambda):
+        return FlatLambdaExpr(a_lambda.args, self.lower(a_lambda.body),
+                              a_lambda.free_vars, a_lambda.free_refs,
+                              a_lambda.let_vars)
+
+    def visit_primapp(self, a_primapp):
+        return PrimAppExpr(a_primapp.name, self.lower_all(a_primapp.rands),
+                           a_primapp.prim)
+
+    def visit_app(self, an_app):
+        return AppExpr(self.lower(an_app.rator), self.lower_all(an_app.rands))
+
+    def visit_resolved(self, a_resolved):
+        return ResolvedExpr(self.lower(a_resolved.body), a_resolved.let_vars)
+
+
+def lower(ast):
+    return Lowerer().lower(ast)
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+
+from .ast import GlobalRefExpr, LambdaExpr
+from .optimize import shadow
+
+
+class Purity:
+    # Marks every LambdaExpr with pure = True when its body has no
+    # effects: only pure prims, no closures made, and calls only to
+    # lambdas bound by an enclosing let or letrec that are pure too.
+    # Visits return whether the expression itself is pure; known maps a
+    # variable to the LambdaExpr it is bound to.
+    def check(self, ast, known):
+        return ast.visit(self, known)
+
+    def check_all(self, asts, known):
+        # no short cut, every nested lambda gets marked
+        results = [self.check(a, known) for a in asts]
+        return all(results)
+
+    def body_pure(self, a_lambda, known):
+        return self.check(a_lambda.body, shadow(known, a_lambda.args))
+
+    def visit_let(self, a_let, known):
+        pure = self.check_all(a_let.b_exprs, known)
+        body_known = dict(shadow(known, a_let.b_vars))
+        for b_var, b_expr in zip(a_let.b_vars, a_let.b_exprs):
+            if isinstance(b_expr, LambdaExpr):
+                body_known[b_var] = b_expr
+        return self.check(a_let.body, body_known) and pure
+
+    visit_letprim = visit_let
+
+    def visit_primif(self, a_primif, known):
+        pure = self.check_all(a_primif.b_exprs, known)
+        known = shadow(known, a_primif.b_vars)
+        return self.check_all([a_primif.test, a_primif.conseq, a_primif.alter],
+                              known) and pure
+
+    def visit_letapp(self, a_let, known):
+        pure = self.check(a_let.app, known)
+        return self.check(a_let.body, shadow(known, a_let.b_vars)) and pure
+
+    def visit_letrec(self, a_letrec, known):
+        known = dict(shadow(known, a_letrec.b_vars))
+        known.update(zip(a_letrec.b_vars, a_letrec.b_exprs))
+        for a_lambda in a_letrec.b_exprs:
+            a_lambda.pure = True
+        changed = True
+        while changed:
+            changed = False
+            for a_lambda in a_letrec.b_exprs:
+                if a_lambda.pure and not self.body_pure(a_lambda, known):
+                    a_lambda.pure = False
+                    changed = True
+        # settle the lambdas nested in the group
+        for a_lambda in a_letrec.b_exprs:
+            self.body_pure(a_lambda, known)
+        self.check(a_letrec.body, known)
+        return False
+
+    def visit_seq(self, a_seq, known):
+        return self.check_all(a_seq.exprs, known)
+
+    # pylint: disable=unused-argument
+    def visit_ref(self, a_ref, known):
+        return True
+
+    visit_lexref = visit_ref
+    visit_globalref = visit_ref
+    visit_datum = visit_ref
+
+    def visit_if(self, an_if, known):
+        return self.check_all([an_if.test, an_if.conseq, an_if.alter], known)
+
+    def visit_lambda(self, a_lambda, known):
+        a_lambda.pure = self.body_pure(a_lambda, known)
+        # making a closure is not pure, each one is a new value
+        return False
+
+    visit_flatlambda = visit_lambda
+
+    def visit_primapp(self, a_primapp, known):
+        return self.check_all(a_primapp.rands, known) and a_primapp.prim.pure
+
+    def visit_app(self, an_app, known):
+        pure = self.check_all(an_app.rands, known)
+        callee = None
+        if not isinstance(an_app.rator, GlobalRefExpr):
+            callee = known.get(getattr(an_app.rator, 'name', None))
+        return pure and callee is not None and callee.pure
+
+    def visit_resolved(self, a_resolved, known):
+        return self.check(a_resolved.body, known)
+
+
+def mark_pure(ast):
+    Purity().check(ast, {})
+    return ast
+
+
+class MemoCache:
+    # LRU table of pure closure results keyed on the closure and the
+    # (type, value) of each arg.
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key, default=None):
+        value = self.table.get(key, default)
+        if value is default:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.table.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        self.table[key] = value
+        self.table.move_to_end(key)
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.table.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.table),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,164 @@
+from .ast import (AppExpr, DatumExpr, IfExpr, LambdaExpr, LetExpr,
+                  LetRecExpr, PrimAppExpr, RefExpr, SeqExpr)
+from .letrec import eliminate_boxes
+from .prim import Primitives
+from .resolve import free_vars
+
+
+class Binders:
+    # Collects every name bound anywhere in an AST.
+    def __init__(self):
+        self.names = set()
+
+    def scan(self, ast):
+        ast.visit(self)
+
+    def visit_let(self, a_let):
+        self.names.update(a_let.b_vars)
+        for b_expr in a_let.b_exprs:
+            self.scan(b_expr)
+        self.scan(a_let.body)
+
+    visit_letrec = visit_let
+
+    def visit_seq(self, a_seq):
+        for expr in a_seq.exprs:
+            self.scan(expr)
+
+    def visit_if(self, an_if):
+        self.scan(an_if.test)
+        self.scan(an_if.conseq)
+        self.scan(an_if.alter)
+
+    def visit_lambda(self, a_lambda):
+        self.names.update(a_lambda.args)
+        self.scan(a_lambda.body)
+
+    def visit_primapp(self, a_primapp):
+        for rand in a_primapp.rands:
+            self.scan(rand)
+
+    def visit_app(self, an_app):
+        self.scan(an_app.rator)
+        for rand in an_app.rands:
+            self.scan(rand)
+
+    # pylint: disable=unused-argument
+    def visit_ref(self, a_ref):
+        pass
+
+    visit_datum = visit_ref
+
+
+def binders(ast):
+    finder = Binders()
+    finder.scan(ast)
+    return finder.names
+
+
+def shadow(subst, names):
+    if not any(name in subst for name in names):
+        return subst
+    return {k: v for k, v in subst.items() if k not in names}
+
+
+class Optimizer(Primitives):
+    # Constant folding, copy propagation and dead binding elimination over
+    # unresolved ASTs.  subst maps a variable to the atomic expression
+    # that replaces it.
+    def optimize(self, ast, subst):
+        return ast.visit(self, subst)
+
+    def is_pure(self, ast):
+        if isinstance(ast, (DatumExpr, RefExpr, LambdaExpr)):
+            return True
+        if isinstance(ast, PrimAppExpr):
+            return ast.prim.pure
+        return False
+
+    def visit_let(self, a_let, subst):
+        b_vars = a_let.b_vars
+        b_exprs = [self.optimize(e, subst) for e in a_let.b_exprs]
+        if len(set(b_vars)) != len(b_vars):
+            body = self.optimize(a_let.body, shadow(subst, b_vars))
+            return LetExpr(b_vars, b_exprs, body)
+
+        body_subst = dict(shadow(subst, b_vars))
+        rebound = None
+        kept = []
+        for b_var, b_expr in zip(b_vars, b_exprs):
+            if isinstance(b_expr, DatumExpr):
+                body_subst[b_var] = b_expr
+                continue
+            if isinstance(b_expr, RefExpr):
+                if rebound is None:
+                    # the let's own vars shadow the copy in the body too
+                    rebound = binders(a_let.body) | set(b_vars)
+                if b_expr.name not in rebound:
+                    body_subst[b_var] = b_expr
+                    continue
+            kept.append((b_var, b_expr))
+
+        body = self.optimize(a_let.body, body_subst)
+        used = free_vars(body)
+        kept = [(v, e) for v, e in kept if v in used or not self.is_pure(e)]
+        if not kept:
+            return body
+        return LetExpr([v for v, _ in kept], [e for _, e in kept], body)
+
+    def visit_letrec(self, a_letrec, subst):
+        subst = shadow(subst, a_letrec.b_vars)
+        return LetRecExpr(a_letrec.b_vars,
+                          [self.optimize(e, subst) for e in a_letrec.b_exprs],
+                          self.optimize(a_letrec.body, subst))
+
+    def visit_seq(self, a_seq, subst):
+        exprs = [self.optimize(e, subst) for e in a_seq.exprs]
+        exprs = [e for e in exprs[:-1] if not self.is_pure(e)] + exprs[-1:]
+        if len(exprs) == 1:
+            return exprs[0]
+        return SeqExpr(exprs)
+
+    def visit_ref(self, a_ref, subst):
+        return subst.get(a_ref.name, a_ref)
+
+    # pylint: disable=unused-argument
+    def visit_datum(self, a_datum, subst):
+        return a_datum
+
+    def visit_if(self, an_if, subst):
+        test = self.optimize(an_if.test, subst)
+        if isinstance(test, DatumExpr):
+            if test.value is not False:
+                return self.optimize(an_if.conseq, subst)
+            return self.optimize(an_if.alter, subst)
+        return IfExpr(test,
+                      self.optimize(an_if.conseq, subst),
+                      self.optimize(an_if.alter, subst))
+
+    def visit_lambda(self, a_lambda, subst):
+        body = self.optimize(a_lambda.body, shadow(subst, a_lambda.args))
+        return LambdaExpr(a_lambda.args, body)
+
+    def visit_primapp(self, a_primapp, subst):
+        rands = [self.optimize(a, subst) for a in a_primapp.rands]
+        prim = a_primapp.prim
+        if prim.pure and all(isinstance(a, DatumExpr) for a in rands):
+            try:
+                return DatumExpr(prim.fn(self, *[a.value for a in rands]))
+            except Exception: # pylint: disable=broad-except
+                # leave the error for run time
+                pass
+        return PrimAppExpr(a_primapp.name, rands, prim)
+
+    def visit_app(self, an_app, subst):
+        return AppExpr(self.optimize(an_app.rator, subst),
+                       [self.optimize(a, subst) for a in an_app.rands])
+
+    # pylint: disable=unused-argument
+    def visit_resolved(self, a_resolved, subst):
+        return a_resolved
+
+
+def optimize(ast):
+    return Optimizer().optimize(eliminate_boxes(ast), {})
@@ -1,9 +1,27 @@
 # pylint: disable=invalid-name
 
+import inspect
+
 from .type import Box, undefined
 
 
+def pure(fn):
+    # no effects and the result depends only on the arguments
+    fn.pure = True
+    return fn
+
+
+def control(fn):
+    # needs the machine's registers, see Interpreter.call_cc
+    fn.control = True
+    return fn
+
+
 class Primitives:
+    def call_cc(self, proc):
+        # machines with first class continuations override this
+        raise Exception(f'call_cc is not supported by {self.__class__.__name__}')
+
     def prim_box(self, value):
         return Box(value)
 
@@ -16,20 +34,84 @@ class Primitives:
             raise Error('undefined variable accessed')
         return box.value
 
+    @pure
     def prim_is_zero(self, a):
         return a == 0
 
+    @pure
     def prim_is_equal(self, a, b):
         return a == b
 
+    @pure
     def prim_plus(self, a, b):
         return a + b
 
+    @pure
     def prim_mult(self, a, b):
         return a * b
 
+    @pure
     def prim_add1(self, a):
         return a + 1
 
+    @pure
     def prim_sub1(self, a):
         return a - 1
+
+    @control
+    def prim_call_cc(self, proc):
+        return self.call_cc(proc)
+
+
+class PrimInfo:
+    # fn is called with the machine as its first argument.
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, fn, arity, pure=False, control=False, is_async=False):
+        # pylint: disable=redefined-outer-name
+        self.name = name
+        self.fn = fn
+        self.arity = arity
+        self.pure = pure
+        self.control = control
+        self.is_async = is_async
+
+
+class PrimRegistry:
+    def __init__(self):
+        self.entries = {}
+
+    def register(self, name, fn, arity, **flags):
+        info = PrimInfo(name, fn, arity, **flags)
+        self.entries[name] = info
+        return info
+
+    def register_async(self, name, fn, arity):
+        # fn is a coroutine function, the machine suspends until it is
+        # done, see Interpreter.eval_async.
+        def suspend(intp, *args):
+            return intp.await_primitive(fn(*args))
+        return self.register(name, suspend, arity, control=True, is_async=True)
+
+    def unregister(self, name):
+        del self.entries[name]
+
+    def register_class(self, klass):
+        for attr, fn in inspect.getmembers(klass, inspect.isfunction):
+            if attr.startswith('prim_'):
+                arity = len(inspect.signature(fn).parameters) - 1
+                self.register(attr[5:], fn, arity,
+                              pure=getattr(fn, 'pure', False),
+                              control=getattr(fn, 'control', False))
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def lookup(self, name):
+        info = self.entries.get(name)
+        if info is None:
+            raise Exception(f'unknown primitive {name!r}')
+        return info
+
+
+PRIMITIVES = PrimRegistry()
+PRIMITIVES.register_class(Primitives)
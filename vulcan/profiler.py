@@ -0,0 +1,238 @@
+import time
+
+from .ast import Expr, LambdaExpr, PrimAppExpr
+from .eval import Doing, Interpreter, Suspended
+
+
+def children(ast):
+    for field in ast.fields:
+        value = getattr(ast, field)
+        items = value if isinstance(value, (list, tuple)) else (value,)
+        for item in items:
+            if isinstance(item, Expr):
+                yield item
+
+
+class Profile:
+    # Per node step counts and wall time, per primitive call counts and
+    # time, closure calls per LambdaExpr and the deepest continuation
+    # stack.  folded keeps the time spent under each stack of frame
+    # labels for flamegraph output.
+    def __init__(self):
+        self.ids = {}
+        self.owners = {}
+        self.bodies = {}
+        self.nodes = {}
+        self.prims = {}
+        self.calls = {}
+        self.max_depth = 0
+        self.folded = {}
+        self.paths = {}
+        self.path_labels = [None]
+
+    def scan(self, ast, owner='top'):
+        # numbers the nodes in preorder and finds each node's lambda
+        stack = [(ast, owner)]
+        while stack:
+            node, owner = stack.pop()
+            if node in self.ids:
+                continue
+            self.ids[node] = len(self.ids)
+            self.owners[node] = owner
+            if isinstance(node, LambdaExpr):
+                self.bodies[node.body] = node
+                owner = self.label(node)
+            stack.extend((c, owner) for c in reversed(list(children(node))))
+
+    def label(self, node):
+        if isinstance(node, str):
+            return node
+        if node not in self.ids:
+            self.scan(node)
+        kind = node.__class__.__name__[:-len('Expr')].lower()
+        if isinstance(node, PrimAppExpr):
+            kind = f'prim {node.name}'
+        elif isinstance(node, LambdaExpr):
+            kind = f'lambda ({" ".join(node.args)})'
+        return f'{kind}#{self.ids[node]}'
+
+    def owner(self, node):
+        if isinstance(node, str):
+            return node
+        if node not in self.ids:
+            self.scan(node)
+        return self.owners[node]
+
+    def intern(self, parent, label):
+        key = (parent, label)
+        path = self.paths.get(key)
+        if path is None:
+            path = len(self.path_labels)
+            self.paths[key] = path
+            self.path_labels.append(key)
+        return path
+
+    def record(self, node, path, elapsed):
+        stats = self.nodes.get(node)
+        if stats is None:
+            self.nodes[node] = [1, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+        key = (path, node)
+        self.folded[key] = self.folded.get(key, 0.0) + elapsed
+
+    def record_prim(self, name, elapsed):
+        stats = self.prims.get(name)
+        if stats is None:
+            self.prims[name] = [1, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    def record_call(self, a_lambda):
+        self.calls[a_lambda] = self.calls.get(a_lambda, 0) + 1
+
+    def stack_labels(self, path):
+        labels = []
+        while path:
+            path, label = self.path_labels[path]
+            labels.append(label)
+        labels.reverse()
+        return labels
+
+    def report(self, limit=20):
+        lines = [f'max stack depth {self.max_depth}', '', 'nodes:']
+        nodes = sorted(self.nodes.items(), key=lambda i: i[1][1], reverse=True)
+        for node, (count, elapsed) in nodes[:limit]:
+            lines.append(f'  {self.label(node):<30} {count:9d} '
+                         f'{elapsed * 1000:9.3f} ms')
+        lines += ['', 'prims:']
+        prims = sorted(self.prims.items(), key=lambda i: i[1][1], reverse=True)
+        for name, (count, elapsed) in prims[:limit]:
+            lines.append(f'  {name:<30} {count:9d} {elapsed * 1000:9.3f} ms')
+        lines += ['', 'calls:']
+        calls = sorted(self.calls.items(), key=lambda i: i[1], reverse=True)
+        for a_lambda, count in calls[:limit]:
+            lines.append(f'  {self.label(a_lambda):<30} {count:9d}')
+        return '\n'.join(lines)
+
+    def flamegraph(self):
+        # folded stacks, one 'frame;frame;leaf microseconds' line each.
+        # Repeated labels are merged, so recursion shows as one frame.
+        totals = {}
+        for (path, node), elapsed in self.folded.items():
+            labels = self.stack_labels(path)
+            labels += [self.owner(node), self.label(node)]
+            stack = []
+            for label in labels:
+                if not stack or stack[-1] != label:
+                    stack.append(label)
+            key = ';'.join(stack)
+            totals[key] = totals.get(key, 0.0) + elapsed
+        return '\n'.join(f'{key} {round(elapsed * 1e6)}'
+                         for key, elapsed in sorted(totals.items()))
+
+
+class ProfilingInterpreter(Interpreter):
+    # A CEK interpreter with its own run loop that times every step, so
+    # the plain run loops pay nothing for profiling.
+    def __init__(self, global_env=None, memo=None, clock=time.perf_counter):
+        super().__init__(global_env, memo)
+        self.clock = clock
+        self.profile = Profile()
+        # trail holds (frames, path) for each continuation frame, bottom
+        # first, and index finds a frames cell in it.
+        self.trail = []
+        self.index = {}
+
+    def __setstate__(self, state):
+        # index is keyed by id, which a restored checkpoint changes
+        self.__dict__.update(state)
+        self.index = {id(cell): i for i, (cell, _) in enumerate(self.trail)}
+
+    def load(self, ast):
+        super().load(ast)
+        self.profile.scan(ast)
+        self.trail = []
+        self.index = {}
+        self.track(self.stack.frames)
+
+    def track(self, frames):
+        profile = self.profile
+        pushed = []
+        while frames is not None:
+            i = self.index.get(id(frames))
+            if i is not None and self.trail[i][0] is frames:
+                break
+            pushed.append(frames)
+            frames = frames[1]
+        else:
+            i = -1
+        for cell, _ in self.trail[i + 1:]:
+            del self.index[id(cell)]
+        del self.trail[i + 1:]
+        path = self.trail[-1][1] if self.trail else 0
+        for cell in reversed(pushed):
+            node = getattr(cell[0], 'ast', cell[0].__class__.__name__)
+            path = profile.intern(path, profile.owner(node))
+            self.index[id(cell)] = len(self.trail)
+            self.trail.append((cell, path))
+        if len(self.trail) > profile.max_depth:
+            profile.max_depth = len(self.trail)
+
+    def profiled_step(self):
+        state = self.state
+        before = self.stack.frames
+        if state.__class__ is Doing:
+            node = state.ast
+        else:
+            # a return is charged to the frame it returns to
+            frame = before[0]
+            node = getattr(frame, 'ast', frame.__class__.__name__)
+        path = self.trail[-1][1] if self.trail else 0
+        start = self.clock()
+        self.step()
+        elapsed = self.clock() - start
+        self.profile.record(node, path, elapsed)
+        if self.stack.frames is not before:
+            self.track(self.stack.frames)
+        state = self.state
+        if state.__class__ is Doing:
+            a_lambda = self.profile.bodies.get(state.ast)
+            if a_lambda is not None:
+                self.profile.record_call(a_lambda)
+
+    def run(self, max_steps=None):
+        steps = 0
+        try:
+            while not self.halt:
+                if max_steps is not None and steps >= max_steps:
+                    return Suspended(self)
+                self.profiled_step()
+                steps += 1
+        finally:
+            self.last_steps = steps
+        if self.pending is not None:
+            return Suspended(self)
+        return self.state.value
+
+    def do_primitive(self, prim, args):
+        start = self.clock()
+        value = prim.fn(self, *args)
+        self.profile.record_prim(prim.name, self.clock() - start)
+        self.done(value)
+
+    def inline_eval(self, ast):
+        if isinstance(ast, PrimAppExpr):
+            start = self.clock()
+            value = super().inline_eval(ast)
+            self.profile.record_prim(ast.name, self.clock() - start)
+            return value
+        return super().inline_eval(ast)
+
+
+def profile(ast, make_interpreter=ProfilingInterpreter):
+    intp = make_interpreter()
+    value = intp.eval(ast)
+    return value, intp.profile
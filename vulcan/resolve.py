@@ -0,0 +1,188 @@
+from .ast import (AppExpr, FlatLambdaExpr, GlobalRefExpr, IfExpr, LambdaExpr,
+                  LetExpr, LetRecExpr, LexRefExpr, PrimAppExpr, RefExpr,
+                  ResolvedExpr, SeqExpr)
+from .eval import last_index
+
+
+class Scope:
+    # pylint: disable=redefined-builtin
+    # Compile time mirror of the FrameEnv chain.  A scope made without a
+    # frame starts a new one, for a lambda or the program.  A let scope
+    # adds its vars to the frame of the scope it is in, from slot on, so
+    # only frames count towards a depth.
+    def __init__(self, parent, vars, frame=None):
+        self.parent = parent
+        self.vars = vars
+        if frame is None:
+            frame = []
+        self.frame = frame
+        self.slot = len(frame)
+        frame.extend(vars)
+
+    def let(self, vars):
+        return Scope(self, vars, self.frame)
+
+    def address(self, name):
+        scope = self
+        depth = 0
+        while scope is not None:
+            slot = last_index(scope.vars, name)
+            if slot >= 0:
+                return depth, scope.slot + slot
+            parent = scope.parent
+            if parent is not None and parent.frame is not scope.frame:
+                depth += 1
+            scope = parent
+        return None
+
+
+class FreeVars:
+    # Collects the names referenced but not bound in an AST, in order of
+    # first reference.
+    def __init__(self):
+        self.names = []
+
+    def scan(self, ast, bound):
+        ast.visit(self, bound)
+
+    def scan_all(self, asts, bound):
+        for a in asts:
+            self.scan(a, bound)
+
+    def visit_let(self, a_let, bound):
+        self.scan_all(a_let.b_exprs, bound)
+        self.scan(a_let.body, bound | set(a_let.b_vars))
+
+    def visit_letrec(self, a_letrec, bound):
+        bound = bound | set(a_letrec.b_vars)
+        self.scan_all(a_letrec.b_exprs, bound)
+        self.scan(a_letrec.body, bound)
+
+    def visit_seq(self, a_seq, bound):
+        self.scan_all(a_seq.exprs, bound)
+
+    def visit_ref(self, a_ref, bound):
+        if a_ref.name not in bound and a_ref.name not in self.names:
+            self.names.append(a_ref.name)
+
+    visit_lexref = visit_ref
+    visit_globalref = visit_ref
+
+    def visit_datum(self, a_datum, bound):
+        pass
+
+    def visit_if(self, an_if, bound):
+        self.scan(an_if.test, bound)
+        self.scan(an_if.conseq, bound)
+        self.scan(an_if.alter, bound)
+
+    def visit_lambda(self, a_lambda, bound):
+        self.scan(a_lambda.body, bound | set(a_lambda.args))
+
+    visit_flatlambda = visit_lambda
+
+    def visit_primapp(self, a_primapp, bound):
+        self.scan_all(a_primapp.rands, bound)
+
+    def visit_app(self, an_app, bound):
+        self.scan(an_app.rator, bound)
+        self.scan_all(an_app.rands, bound)
+
+    def visit_resolved(self, a_resolved, bound):
+        self.scan(a_resolved.body, bound)
+
+
+def free_vars(ast, bound=()):
+    finder = FreeVars()
+    finder.scan(ast, set(bound))
+    return finder.names
+
+
+class Resolver:
+    def resolve(self, ast, scope):
+        return ast.visit(self, scope)
+
+    def resolve_all(self, asts, scope):
+        return [self.resolve(a, scope) for a in asts]
+
+    def visit_let(self, a_let, scope):
+        b_exprs = self.resolve_all(a_let.b_exprs, scope)
+        scope = scope.let(a_let.b_vars)
+        body = self.resolve(a_let.body, scope)
+        return LetExpr(a_let.b_vars, b_exprs, body, scope.slot)
+
+    def visit_letrec(self, a_letrec, scope):
+        # The closures are created before the slots are filled, so they
+        # keep the env chain rather than copying a record.
+        scope = scope.let(a_letrec.b_vars)
+        b_exprs = [LambdaExpr(l.args, *self.resolve_body(l, Scope(scope, l.args)))
+                   for l in a_letrec.b_exprs]
+        return LetRecExpr(a_letrec.b_vars, b_exprs,
+                          self.resolve(a_letrec.body, scope), scope.slot)
+
+    def resolve_body(self, a_lambda, body_scope):
+        # the body and the let_vars its lets add to the lambda's frame
+        body = self.resolve(a_lambda.body, body_scope)
+        return body, body_scope.frame[len(a_lambda.args):]
+
+    def visit_seq(self, a_seq, scope):
+        return SeqExpr(self.resolve_all(a_seq.exprs, scope))
+
+    def visit_ref(self, a_ref, scope):
+        address = scope.address(a_ref.name)
+        if address is None:
+            return GlobalRefExpr(a_ref.name)
+        depth, slot = address
+        return LexRefExpr(a_ref.name, depth, slot)
+
+    # pylint: disable=unused-argument
+    def visit_lexref(self, a_ref, scope):
+        return a_ref
+
+    # pylint: disable=unused-argument
+    def visit_globalref(self, a_ref, scope):
+        return a_ref
+
+    # pylint: disable=unused-argument
+    def visit_datum(self, a_datum, scope):
+        return a_datum
+
+    def visit_if(self, an_if, scope):
+        return IfExpr(self.resolve(an_if.test, scope),
+                      self.resolve(an_if.conseq, scope),
+                      self.resolve(an_if.alter, scope))
+
+    def visit_lambda(self, a_lambda, scope):
+        # Only variables bound in scope are captured, anything else is a
+        # global and stays a GlobalRefExpr in the body.
+        free = [name for name in free_vars(a_lambda.body, a_lambda.args)
+                if scope.address(name) is not None]
+        free_refs = [self.visit_ref(RefExpr(name), scope) for name in free]
+        body_scope = Scope(Scope(None, free), a_lambda.args)
+        body, let_vars = self.resolve_body(a_lambda, body_scope)
+        return FlatLambdaExpr(a_lambda.args, body, free, free_refs, let_vars)
+
+    # pylint: disable=unused-argument
+    def visit_flatlambda(self, a_lambda, scope):
+        return a_lambda
+
+    def visit_primapp(self, a_primapp, scope):
+        return PrimAppExpr(a_primapp.name,
+                           self.resolve_all(a_primapp.rands, scope),
+                           a_primapp.prim)
+
+    def visit_app(self, an_app, scope):
+        return AppExpr(self.resolve(an_app.rator, scope),
+                       self.resolve_all(an_app.rands, scope))
+
+    # pylint: disable=unused-argument
+    def visit_resolved(self, a_resolved, scope):
+        return a_resolved
+
+
+def resolve(ast):
+    if isinstance(ast, ResolvedExpr):
+        return ast
+    scope = Scope(None, [])
+    body = Resolver().resolve(ast, scope)
+    return ResolvedExpr(body, scope.frame)
@@ -0,0 +1,60 @@
+from collections import deque
+
+from .eval import RegisterInterpreter, Suspended
+
+
+class Task:
+    def __init__(self, intp, ast, name=None):
+        self.intp = intp
+        self.name = name
+        self.value = None
+        self.error = None
+        self.finished = False
+        self.steps = 0
+        intp.load(ast)
+
+    def run(self, quantum):
+        try:
+            result = self.intp.run(quantum)
+        except Exception as error: # pylint: disable=broad-except
+            # one failing script must not take down the scheduler
+            self.error = error
+            self.finished = True
+            return
+        finally:
+            self.steps += self.intp.last_steps
+        if not isinstance(result, Suspended):
+            self.value = result
+            self.finished = True
+
+
+class Scheduler:
+    # Round robin green threads: every ready task runs for at most
+    # quantum machine steps before the next one gets a turn.
+    def __init__(self, quantum=1000, make_interpreter=RegisterInterpreter):
+        self.quantum = quantum
+        self.make_interpreter = make_interpreter
+        self.ready = deque()
+
+    def spawn(self, ast, name=None, intp=None):
+        if intp is None:
+            intp = self.make_interpreter()
+        task = Task(intp, ast, name)
+        self.ready.append(task)
+        return task
+
+    def run_once(self):
+        task = self.ready.popleft()
+        task.run(self.quantum)
+        if not task.finished:
+            self.ready.append(task)
+        return task
+
+    def run(self):
+        # returns the tasks in the order they finished
+        finished = []
+        while self.ready:
+            task = self.run_once()
+            if task.finished:
+                finished.append(task)
+        return finished
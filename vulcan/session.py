@@ -0,0 +1,31 @@
+from .eval import GlobalEnv, RegisterInterpreter
+from .resolve import resolve
+
+
+class Session:
+    # A top level whose definitions persist between programs.  Programs
+    # are resolved, so their free names are looked up in the session's
+    # globals when they run; a later definition is seen by closures made
+    # before it.
+    def __init__(self, global_env=None, make_interpreter=RegisterInterpreter,
+                 prepare=resolve):
+        if global_env is None:
+            global_env = GlobalEnv()
+        self.global_env = global_env
+        self.make_interpreter = make_interpreter
+        self.prepare = prepare
+
+    def eval(self, ast):
+        return self.make_interpreter(self.global_env).eval(self.prepare(ast))
+
+    def define(self, name, ast):
+        value = self.eval(ast)
+        self.global_env = self.global_env.define(name, value)
+        return value
+
+    def define_all(self, definitions):
+        for name, ast in definitions:
+            self.define(name, ast)
+
+    def fork(self):
+        return Session(self.global_env, self.make_interpreter, self.prepare)
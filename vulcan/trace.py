@@ -0,0 +1,227 @@
+from array import array
+import struct
+from itertools import count
+import sys
+
+from .ast import AppExpr
+from .eval import Doing, Done, Interpreter, RegisterInterpreter
+from .profiler import children
+from .type import Continuation, unlink
+
+
+DOING = 0
+DONE = 1
+PUSH_K = 2
+RET = 3
+APPLY = 4
+
+KINDS = ('doing', 'done', 'push_k', 'ret', 'apply')
+
+_MAGIC = b'VTRC'
+_HEADER = struct.Struct('<4sI')
+
+
+class TraceBuffer:
+    # A fixed size ring of (step, node id, kind, depth) records packed
+    # four to a row in one array of 64 bit ints.
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.data = array('q', [0]) * (4 * capacity)
+        self.pos = 0
+        self.written = 0
+
+    def append(self, step, node, kind, depth):
+        i = self.pos * 4
+        data = self.data
+        data[i] = step
+        data[i + 1] = node
+        data[i + 2] = kind
+        data[i + 3] = depth
+        self.pos = (self.pos + 1) % self.capacity
+        self.written += 1
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def records(self):
+        # oldest first
+        n = len(self)
+        start = self.pos - n if self.written > self.capacity else 0
+        data = self.data
+        for i in range(start, start + n):
+            j = (i % self.capacity) * 4
+            yield (data[j], data[j + 1], data[j + 2], data[j + 3])
+
+    def to_bytes(self):
+        rows = array('q')
+        for record in self.records():
+            rows.extend(record)
+        if sys.byteorder == 'big':
+            rows.byteswap()
+        return _HEADER.pack(_MAGIC, len(self)) + rows.tobytes()
+
+    def dump(self, path):
+        with open(path, 'wb') as out:
+            out.write(self.to_bytes())
+
+
+def load_trace(path):
+    with open(path, 'rb') as src:
+        data = src.read()
+    magic, n = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise Exception(f'{path} is not a trace file')
+    rows = array('q')
+    rows.frombytes(data[_HEADER.size:_HEADER.size + 32 * n])
+    if sys.byteorder == 'big':
+        rows.byteswap()
+    return [tuple(rows[i:i + 4]) for i in range(0, len(rows), 4)]
+
+
+def number_nodes(ast, nodes):
+    # gives each node a process wide trace_id once, so tracing a step
+    # reads an attribute instead of probing a dict
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        i = node.__dict__.get('trace_id')
+        if i is None:
+            i = next(_node_ids)
+            node.trace_id = i
+        elif i in nodes:
+            continue
+        nodes[i] = node
+        stack.extend(children(node))
+
+
+_node_ids = count()
+
+
+class Tracing:
+    # What both tracing interpreters share: the buffer, node ids, the
+    # dump on error and the transition counters.  nodes maps a node id in
+    # the trace back to its node.
+    def __init__(self, global_env=None, memo=None, capacity=4096,
+                 dump_path=None):
+        super().__init__(global_env, memo)
+        self.trace = TraceBuffer(capacity)
+        self.dump_path = dump_path
+        self.nodes = {}
+        self.steps = 0
+        self.depth = 0
+        self.node = -1
+
+    def __setstate__(self, state):
+        # pickled nodes come back without their trace_id
+        self.__dict__.update(state)
+        for i, node in self.nodes.items():
+            node.trace_id = i
+
+    def record(self, kind):
+        # TraceBuffer.append inlined, this runs several times a step
+        trace = self.trace
+        i = trace.pos
+        data = trace.data
+        j = 4 * i
+        data[j] = self.steps
+        data[j + 1] = self.node
+        data[j + 2] = kind
+        data[j + 3] = self.depth
+        trace.pos = i + 1 if i + 1 < trace.capacity else 0
+        trace.written += 1
+
+    def load(self, ast):
+        number_nodes(ast, self.nodes)
+        self.depth = 0
+        super().load(ast)
+
+    def run(self, max_steps=None):
+        try:
+            return super().run(max_steps)
+        except Exception:
+            if self.dump_path is not None:
+                self.trace.dump(self.dump_path)
+            raise
+
+
+class TracingInterpreter(Tracing, Interpreter):
+    # A CEK interpreter that records every machine transition in a
+    # TraceBuffer.  Done and ret records carry the id of the last node
+    # being done.  With dump_path set the trace is written there when
+    # run raises.
+    def step(self):
+        self.steps += 1
+        self.state.step(self)
+
+    def doing(self, ast):
+        assert ast is not None
+        self.state = Doing(ast)
+        self.node = ast.trace_id
+        self.record(DOING)
+
+    def done(self, a_value):
+        self.state = Done(a_value)
+        self.record(DONE)
+
+    def push_k(self, k):
+        self.stack.push(k)
+        self.depth += 1
+        self.record(PUSH_K)
+
+    def ret(self, a_value):
+        self.depth -= 1
+        self.record(RET)
+        super().ret(a_value)
+
+    def visit_app(self, an_app):
+        self.node = an_app.trace_id
+        self.record(APPLY)
+        super().visit_app(an_app)
+
+    def apply_procedure(self, proc, args):
+        super().apply_procedure(proc, args)
+        if proc.__class__ is Continuation:
+            self.depth = len(unlink(self.stack.frames))
+
+
+class TracingRegisterInterpreter(Tracing, RegisterInterpreter):
+    # The register run loop calls trace_step before each step with its
+    # control and continuation registers.  A step records doing, or apply
+    # for an application, when it has a node to run and ret when it
+    # returns a value to the top frame; done is folded into ret.  Depth
+    # follows the continuation register, counting it again when it was
+    # replaced by anything but a push, e.g. by a continuation.
+    def load(self, ast):
+        super().load(ast)
+        self.frames = self.stack.frames
+        self.depth = 1
+
+    def trace_step(self, ast, frames):
+        self.steps += 1
+        last = self.frames
+        if frames is not last:
+            if frames[1] is last:
+                self.depth += 1
+                self.record(PUSH_K)
+            else:
+                self.depth = len(unlink(frames))
+            self.frames = frames
+        if ast is not None:
+            node = self.node = ast.trace_id
+            kind = APPLY if ast.__class__ is AppExpr else DOING
+        else:
+            node = self.node
+            kind = RET
+            self.depth -= 1
+            self.frames = frames[1]
+        # record inlined, once per step
+        trace = self.trace
+        i = trace.pos
+        data = trace.data
+        j = 4 * i
+        data[j] = self.steps
+        data[j + 1] = node
+        data[j + 2] = kind
+        data[j + 3] = self.depth
+        trace.pos = i + 1 if i + 1 < trace.capacity else 0
+        trace.written += 1
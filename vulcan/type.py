@@ -1,7 +1,9 @@
 
 
 class Undefined:
-    pass
+    def __reduce__(self):
+        # unpickles as the module level singleton
+        return 'undefined'
 
 undefined = Undefined()
 
@@ -11,11 +13,52 @@ class Box:
         self.value = value
 
 
+def check_arity(a_lambda, vals):
+    if len(vals) != a_lambda.arity:
+        raise Exception(f'arity mismatch: expected {a_lambda.arity} '
+                        f'arguments got {len(vals)}')
+
+
 class Closure:
     def __init__(self, env, ast):
         self.env = env
         self.ast = ast
 
     def apply(self, intp, vals):
-        intp.env = self.env.extend(self.ast.args, vals)
-        intp.doing(self.ast.body)
+        check_arity(self.ast, vals)
+        intp.enter_closure(self, vals)
+
+
+def unlink(frames):
+    # a linked list of (frame, rest) pairs as a flat list, top first
+    ret = []
+    while frames is not None:
+        top, frames = frames
+        ret.append(top)
+    return ret
+
+
+def link(a_list):
+    frames = None
+    for frame in reversed(a_list):
+        frames = (frame, frames)
+    return frames
+
+
+def linked_continuation(a_list):
+    return Continuation(link(a_list))
+
+
+class Continuation:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def __reduce__(self):
+        # flattened so deep stacks do not hit the pickle recursion limit
+        return linked_continuation, (unlink(self.frames),)
+
+    def apply(self, intp, vals):
+        if len(vals) != 1:
+            raise Exception(f'continuation expects 1 value got {len(vals)}')
+        intp.stack.restore(self.frames)
+        intp.done(vals[0])